@@ -0,0 +1,113 @@
+import argparse
+import sys
+import timeit
+from coordinates.coordinate_vector_3d import Cartesian3DVector
+from coordinates.particle_coordinates import ParticlePhaseCoordinates
+
+"""
+Microbenchmark of the per-object coordinate classes.  The reference
+classes below keep their components in the instance __dict__ and build
+dicts on every operation, the way CoordinateVector used to, so the
+savings of the __slots__ layout can be measured per million particles.
+"""
+
+class DictVector():
+  """
+  Reference vector storing its components as instance attributes.
+  """
+
+  def __init__(self,x=0,y=0,z=0):
+    self.order = ["x","y","z"]
+    values = {"x":float(x), "y":float(y), "z":float(z)}
+    for coordinate in self.order:
+      setattr(self,coordinate,values[coordinate])
+
+  def getVector(self):
+    return [getattr(self,coordinate) for coordinate in self.order]
+
+  def __add__(self,other):
+    values = {}
+    vector = self.getVector()
+    other_vector = other.getVector()
+    for i in range(len(self.order)):
+      values[self.order[i]] = other_vector[i]+vector[i]
+    return DictVector(**values)
+
+class DictParticle():
+  """
+  Reference particle with position, momentum and velocity in __dict__.
+  """
+
+  def __init__(self,mass,x,p,v):
+    self.mass = mass
+    self.x = x
+    self.p = p
+    self.v = v
+
+def deep_size_of(obj,seen=None):
+  """
+  Returns the bytes held by obj, its __dict__ or __slots__ and the objects
+  they reference.  Objects already counted (shared order lists, classes)
+  are skipped.
+  """
+  if seen is None:
+    seen = set()
+  if id(obj) in seen or isinstance(obj,type):
+    return 0
+  seen.add(id(obj))
+  size = sys.getsizeof(obj)
+  if isinstance(obj,(tuple,list)):
+    size += sum([deep_size_of(item,seen) for item in obj])
+  if hasattr(obj,"__dict__"):
+    size += deep_size_of(obj.__dict__,seen)
+    size += sum([deep_size_of(value,seen) for value in obj.__dict__.values()])
+  for cls in type(obj).__mro__ if hasattr(type(obj),"__mro__") else []:
+    for slot in cls.__dict__.get("__slots__",()):
+      if hasattr(obj,slot):
+        size += deep_size_of(getattr(obj,slot),seen)
+  return size
+
+def bytes_per_particle(make_particle,samples=1000):
+  """
+  Averages the deep size of freshly made particles.
+  """
+  seen = set()
+  particles = [make_particle(i) for i in range(samples)]
+  return float(sum([deep_size_of(particle,seen) for particle in particles]))/samples
+
+def seconds_per_million(statement,number):
+  """
+  Times the statement and scales the best of three runs to 1e6 calls.
+  """
+  return min(timeit.repeat(statement,repeat=3,number=number))*1.e6/number
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Compares memory and time per million particles of the __slots__ coordinate classes against dict based ones.')
+  parser.add_argument('-n','--number', dest="number", type=int, help='The number of calls timed per measurement.  Defaults to 100000.', default=100000)
+  args = parser.parse_args()
+
+  slotted = lambda i: ParticlePhaseCoordinates(1.,x=Cartesian3DVector(i,2,3),p=Cartesian3DVector(i,5,6))
+  dicted = lambda i: DictParticle(1.,DictVector(i,2,3),DictVector(i,5,6),DictVector(i,5,6))
+  slotted_bytes = bytes_per_particle(slotted)
+  dicted_bytes = bytes_per_particle(dicted)
+  print "Memory per million particles [MB] (equal to bytes per particle)"
+  print "  dict:  {:>10.1f}".format(dicted_bytes)
+  print "  slots: {:>10.1f}".format(slotted_bytes)
+
+  a = Cartesian3DVector(1,2,3)
+  b = Cartesian3DVector(4,5,6)
+  da = DictVector(1,2,3)
+  db = DictVector(4,5,6)
+  timings = [("create", lambda: DictVector(1,2,3), lambda: Cartesian3DVector(1,2,3)),
+             ("getVector", da.getVector, a.getVector),
+             ("add", lambda: da + db, lambda: a + b),
+             ("sub", None, lambda: a - b),
+             ("dot", None, lambda: a * b)]
+  print "Seconds per million calls"
+  print "  {:<10}{:>10}{:>10}".format("","dict","slots")
+  for name, dict_call, slot_call in timings:
+    if dict_call is None: #No dict reference for these; report slots only.
+      print "  {:<10}{:>10}{:>10.3f}".format(name,"-",seconds_per_million(slot_call,args.number))
+      continue
+    print "  {:<10}{:>10.3f}{:>10.3f}".format(name,seconds_per_million(dict_call,args.number),
+                                              seconds_per_million(slot_call,args.number))
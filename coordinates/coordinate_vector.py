@@ -3,11 +3,28 @@ import math
 class CoordinateException(Exception):
   pass
 
-class CoordinateVector():
+def component_property(index,doc=None):
+  """
+  Returns a property that reads and writes the index-th component of a
+  CoordinateVector.  Subclasses use it to give fixed accessors such as x.
+  """
+  def getter(self):
+    return self._values[index]
+  def setter(self,value):
+    values = list(self._values)
+    values[index] = value
+    self._values = tuple(values)
+  return property(getter,setter,doc=doc)
+
+class CoordinateVector(object):
   """
   Base class to handle methods applicable to all coordinate systems.
+  The components are kept in a single tuple in the order of the
+  coordinates, so vectors carry no instance __dict__.
   """
 
+  __slots__ = ("order","_values")
+
   def __init__(self,order=[],values={}):
     """
     Order is the name of the coordinates and the order in which they will be referred, and
@@ -17,7 +34,18 @@ class CoordinateVector():
       raise CoordinateException("Expect all coordinates in a coordinate vector to have a value")
     self.setOrder(order)
     self.setVector(values)
-      
+
+  @classmethod
+  def fromValues(cls,order,values):
+    """
+    Creates a vector of class cls directly from the ordered tuple of
+    components without building a dict.
+    """
+    instance = object.__new__(cls)
+    instance.order = order
+    instance._values = values
+    return instance
+
   def setOrder(self,order):
     """
     Sets the order to the provided order list.
@@ -32,25 +60,34 @@ class CoordinateVector():
 
   def setVector(self,values):
     """
-    Sets the coordinate as an attribute to the provided value.
+    Sets the components to the provided values keyed by coordinate.
     """
-    for coordinate in self.order:
-      setattr(self,coordinate,values[coordinate])
+    self._values = tuple([values[coordinate] for coordinate in self.order])
 
   def getVector(self):
     """
-    Get the values of the vector in the set order.
+    Get the values of the vector in the set order.  The returned tuple is
+    the stored one, so no copy is made.
     """
-    vector = []
-    for coordinate in self.order:
-      vector.append(getattr(self,coordinate))
-    return vector
+    return self._values
+
+  def __getattr__(self,attr):
+    """
+    Gives component access by name for generic vectors whose coordinates
+    have no precomputed accessor.
+    """
+    if attr in ("order","_values"):
+      raise AttributeError(attr)
+    try:
+      return self._values[self.order.index(attr)]
+    except ValueError:
+      raise AttributeError(attr)
 
   def __str__(self):
     """
     Returns the coordinate vector in the specified order separated by the given delimiter.
     """
-    return " ".join([str(x) for x in self.getVector()])
+    return " ".join([str(x) for x in self._values])
 
   def __abs__(self):
     """
@@ -62,7 +99,7 @@ class CoordinateVector():
     """
     Returns the number of coordinates in the vector.
     """
-    return int(len(self.order))
+    return len(self._values)
 
   def __add__(self,other):
     """
@@ -70,32 +107,22 @@ class CoordinateVector():
       1. Other is scalar, add scalar to each component returning vector.
       2. Other is vector, add by components returning vector.
     """
-    if isinstance(other,float) or isinstance(other,int):
-      values = {}
-      vector = self.getVector()
-      for i in range(len(self)):
-        values[self.order[i]] = other+vector[i]
-      instance = CoordinateVector(self.order,values)
-      instance.__class__ = self.__class__
-      return instance
+    if isinstance(other,(float,int)):
+      return self.fromValues(self.order,tuple([other+v for v in self._values]))
     if isinstance(other,CoordinateVector):
-      if len(other) != len(self):
+      if len(other._values) != len(self._values):
         raise CoordinateException("Error: Attempting to add two vectors of different lengths.")
-      values = {}
-      vector = self.getVector()
-      other_vector = other.getVector()
-      for i in range(len(self)):
-        values[self.order[i]] = other_vector[i]+vector[i]
-      instance = CoordinateVector(self.order,values)
-      instance.__class__ = self.__class__
-      return instance
+      if len(self._values) == 3:
+        a, b = self._values, other._values
+        return self.fromValues(self.order,(a[0]+b[0],a[1]+b[1],a[2]+b[2]))
+      return self.fromValues(self.order,tuple([a+b for a, b in zip(self._values,other._values)]))
     raise CoordinateException("Using addition for an unknown class.")
-    
+
   def __iadd__(self,other):
     """
     Defines the meaning of +=.
     """
-    return self.__add__(other)  
+    return self.__add__(other)
 
   def __sub__(self,other):
     """
@@ -103,13 +130,22 @@ class CoordinateVector():
       1. Other is scalar, subtract scalar from each component returning vector.
       2. Other is vector, subtract by components returning vector.
     """
-    return self.__add__(-1*other)
+    if isinstance(other,(float,int)):
+      return self.fromValues(self.order,tuple([v-other for v in self._values]))
+    if isinstance(other,CoordinateVector):
+      if len(other._values) != len(self._values):
+        raise CoordinateException("Error: Attempting to subtract two vectors of different lengths.")
+      if len(self._values) == 3:
+        a, b = self._values, other._values
+        return self.fromValues(self.order,(a[0]-b[0],a[1]-b[1],a[2]-b[2]))
+      return self.fromValues(self.order,tuple([a-b for a, b in zip(self._values,other._values)]))
+    raise CoordinateException("Using subtraction for an unknown class.")
 
   def __isub__(self,other):
     """
     Defines the meaning of -=.
     """
-    return self.__sub__(other)  
+    return self.__sub__(other)
 
   def __rmul__(self,other):
     """
@@ -117,44 +153,35 @@ class CoordinateVector():
       1.  Other is scaler, scales vector returning vector.
       2.  Other is vector, dot product returning scalar.
     """
-    if isinstance(other,float) or isinstance(other,int):
-      values = {}
-      vector = self.getVector()
-      for i in range(len(self)):
-        values[self.order[i]] = other*vector[i]
-      instance = CoordinateVector(self.order,values)
-      instance.__class__ = self.__class__
-      return instance
+    if isinstance(other,(float,int)):
+      if len(self._values) == 3:
+        a = self._values
+        return self.fromValues(self.order,(other*a[0],other*a[1],other*a[2]))
+      return self.fromValues(self.order,tuple([other*v for v in self._values]))
     if isinstance(other,CoordinateVector):
-      if len(other) != len(self):
+      if len(other._values) != len(self._values):
         raise CoordinateException("Error: Attempting to multiply two vectors of different lengths.")
-      sqsum = 0
-      vector = self.getVector()
-      other_vector = other.getVector()
-      for i in range(len(self)):
-        sqsum += other_vector[i]*vector[i]
-      return sqsum
+      if len(self._values) == 3:
+        a, b = self._values, other._values
+        return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+      return sum([a*b for a, b in zip(self._values,other._values)])
     raise CoordinateException("Using multiply for an unknown class.")
 
+  __mul__ = __rmul__
+
   def __div__(self,other):
     """
     Defines the meaning of division.  Only works when other is a scalar.
       1.  Other is scaler, scales vector returning vector.
     """
-    if isinstance(other,float) or isinstance(other,int):
-      values = {}
-      vector = self.getVector()
-      for i in range(len(self)):
-        values[self.order[i]] = vector[i]/other
-      instance = CoordinateVector(self.order,values)
-      instance.__class__ = self.__class__
-      return instance
+    if isinstance(other,(float,int)):
+      return self.fromValues(self.order,tuple([v/other for v in self._values]))
     raise CoordinateException("Using division for an unknown class.")
-      
+
+  __truediv__ = __div__
+
   def copy(self):
     """
     Returns a duplicate object with the same values but different reference locations.
     """
     return 1*self
-      
-
@@ -1,18 +1,23 @@
 import math
-from coordinates.coordinate_vector import CoordinateException, CoordinateVector
+from coordinates.coordinate_vector import CoordinateException, CoordinateVector, component_property
 
 class Cartesian3DVector(CoordinateVector):
   """
   The standard x, y, z vector.
   """
 
+  __slots__ = ()
+  order_constant = ["x","y","z"]
+  x = component_property(0)
+  y = component_property(1)
+  z = component_property(2)
+
   def __init__(self,x=0,y=0,z=0):
     """
     Initializes the vector by default to 0,0,0
     """
-    order = ["x","y","z"]
-    values = {"x":float(x), "y":float(y), "z":float(z)}
-    CoordinateVector.__init__(self,order,values)
+    self.order = self.order_constant
+    self._values = (float(x), float(y), float(z))
 
   def convertToCylindrical(self):
     """
@@ -24,7 +29,7 @@ class Cartesian3DVector(CoordinateVector):
     if rho == 0:
       return Cylindrical3DVector(0,0,self.z)
     if self.y >= 0:
-      phi = acos(self.x/rho)
+      phi = math.acos(self.x/rho)
     else:
       phi = pi - math.acos(self.x/rho)
     return Cylindrical3DVector(rho,phi,self.z)
@@ -42,7 +47,7 @@ class Cartesian3DVector(CoordinateVector):
       return Spherical3DVector()
     theta = math.acos(self.z/r)
     if self.y >= 0:
-      phi = acos(self.x/rho)
+      phi = math.acos(self.x/rho)
     else:
       phi = pi - math.acos(self.x/rho)
     return Spherical3DVector(r,phi,theta)
@@ -54,11 +59,9 @@ class Cartesian3DVector(CoordinateVector):
     if isinstance(other,CoordinateVector):
       if len(other) != 3:
         raise CoordinateException("Error: Attempting to do the cross product on a vector that is not 3 dimensions.")
-      values = {}
-      values["x"] = self.y*other.z - self.z*other.y
-      values["y"] = self.z*other.x - self.x*other.z
-      values["z"] = self.x*other.y - self.y*other.x
-      return CoordinateVector(self.order,values)
+      return Cartesian3DVector(self.y*other.z - self.z*other.y,
+                               self.z*other.x - self.x*other.z,
+                               self.x*other.y - self.y*other.x)
     raise CoordinateException("Using the cross product for an unknown class.")
 
 class Cylindrical3DVector(CoordinateVector):
@@ -66,13 +69,18 @@ class Cylindrical3DVector(CoordinateVector):
   The standard rho, phi, z vector.
   """
 
+  __slots__ = ()
+  order_constant = ["rho","phi","z"]
+  rho = component_property(0)
+  phi = component_property(1)
+  z = component_property(2)
+
   def __init__(self,rho=0,phi=0,z=0):
     """
     Initializes the vector by default to 0,0,0
     """
-    order = ["rho","phi","z"]
-    values = {"rho":float(rho), "phi":float(phi), "z":float(z)}
-    CoordinateVector.__init__(self,order,values)
+    self.order = self.order_constant
+    self._values = (float(rho), float(phi), float(z))
 
   def convertToCartesian(self):
     """
@@ -99,13 +107,18 @@ class Spherical3DVector(CoordinateVector):
   The standard r, phi, and theta vector.
   """
 
+  __slots__ = ()
+  order_constant = ["r","phi","theta"]
+  r = component_property(0)
+  phi = component_property(1)
+  theta = component_property(2)
+
   def __init__(self,r=0,phi=0,theta=0):
     """
     Initializes the vector by default to 0,0,0
     """
-    order = ["r","phi","theta"]
-    values = {"r":float(r), "phi":float(phi), "theta":float(theta)}
-    CoordinateVector.__init__(self,order,values)
+    self.order = self.order_constant
+    self._values = (float(r), float(phi), float(theta))
 
   def convertToCartesian(self):
     """
@@ -0,0 +1,284 @@
+import numpy as np
+from coordinates.coordinate_vector import CoordinateException
+from coordinates.coordinate_vector_3d import Cartesian3DVector, Cylindrical3DVector, Spherical3DVector
+
+class CoordinateVectorArray(object):
+  """
+  Base class for N vectors of the same coordinate system stored as an
+  (N,3) numpy array.  The array counterpart of CoordinateVector: every
+  operation acts on all N vectors at once.
+  """
+
+  order = []
+  vector_class = None
+
+  def __init__(self,values=None,**components):
+    """
+    Values is an (N,3) array with the columns in the order of the coordinate
+    system.  Alternatively, the components may be given by name, e.g.
+    Cartesian3DVectorArray(x=x,y=y,z=z), with missing components set to 0.
+    """
+    if values is None:
+      unknown = set(components).difference(self.order)
+      if len(unknown) > 0:
+        raise CoordinateException("Unknown components " + ", ".join(sorted(unknown)) +
+                                  " for coordinates " + ", ".join(self.order))
+      columns = np.broadcast_arrays(*[np.asarray(components.get(c,0.),dtype=np.float64) for c in self.order])
+      values = np.empty((columns[0].size,len(self.order)))
+      for i, column in enumerate(columns):
+        values[:,i] = column.ravel()
+    values = np.asarray(values,dtype=np.float64)
+    if values.ndim != 2 or values.shape[1] != len(self.order):
+      raise CoordinateException("Expect an (N," + str(len(self.order)) + ") array of vectors.")
+    self.values = values
+
+  @classmethod
+  def fromVectors(cls,vectors):
+    """
+    Builds the array from a list of single vectors of the matching class.
+    """
+    return cls(np.array([v.getVector() for v in vectors],dtype=np.float64).reshape(-1,len(cls.order)))
+
+  def getOrder(self):
+    """
+    Gets the order of the vectors.
+    """
+    return self.order
+
+  def getComponent(self,coordinate):
+    """
+    Returns a view of the column of the given coordinate.
+    """
+    if coordinate not in self.order:
+      raise CoordinateException("The coordinate " + str(coordinate) + " is not one of " + ", ".join(self.order))
+    return self.values[:,self.order.index(coordinate)]
+
+  def __getattr__(self,attr):
+    """
+    Allows the components to be accessed as attributes, e.g. vectors.x.
+    """
+    if attr in type(self).order:
+      return self.getComponent(attr)
+    raise AttributeError(attr)
+
+  def __len__(self):
+    """
+    Returns the number of vectors.
+    """
+    return self.values.shape[0]
+
+  def __getitem__(self,index):
+    """
+    An integer index returns the single vector, anything else (slices,
+    masks, index arrays) returns a new vector array.
+    """
+    if isinstance(index,(int,long,np.integer)):
+      return self.vector_class(*self.values[index])
+    return self.__class__(self.values[index])
+
+  def __iter__(self):
+    """
+    Iterates over the single vectors.
+    """
+    for i in range(len(self)):
+      yield self[i]
+
+  def __str__(self):
+    """
+    Returns one vector per line.
+    """
+    return "\n".join([" ".join([str(v) for v in row]) for row in self.values])
+
+  def asOperand(self,other):
+    """
+    Converts other into something that broadcasts against the (N,3) values:
+    scalars stay scalars, length N arrays become columns and vector arrays
+    or single vectors become their values.
+    """
+    if isinstance(other,CoordinateVectorArray):
+      if len(other.order) != len(self.order):
+        raise CoordinateException("Error: Attempting to combine vectors of different lengths.")
+      return other.values
+    if isinstance(other,(Cartesian3DVector,Cylindrical3DVector,Spherical3DVector)):
+      return np.array(other.getVector())
+    other = np.asarray(other,dtype=np.float64)
+    if other.ndim == 1:
+      return other[:,np.newaxis]
+    return other
+
+  def __add__(self,other):
+    """
+    Adds a scalar, per-vector scalars or vectors by components.
+    """
+    return self.__class__(self.values + self.asOperand(other))
+
+  __radd__ = __add__
+
+  def __sub__(self,other):
+    """
+    Subtracts a scalar, per-vector scalars or vectors by components.
+    """
+    return self.__class__(self.values - self.asOperand(other))
+
+  def __neg__(self):
+    return self.__class__(-self.values)
+
+  def __mul__(self,other):
+    """
+    Defines the meaning of multiplication.
+      1.  Other is scalar or a length N array, scales the vectors.
+      2.  Other is a vector or vector array, the dot products.
+    """
+    if isinstance(other,(CoordinateVectorArray,Cartesian3DVector,Cylindrical3DVector,Spherical3DVector)):
+      return self.dot(other)
+    return self.__class__(self.values*self.asOperand(other))
+
+  __rmul__ = __mul__
+
+  def __div__(self,other):
+    """
+    Divides by a scalar or by per-vector scalars.
+    """
+    return self.__class__(self.values/self.asOperand(other))
+
+  __truediv__ = __div__
+
+  def dot(self,other):
+    """
+    Returns the length N array of component-wise dot products.
+    """
+    return np.einsum("ij,ij->i",self.values,np.broadcast_to(self.asOperand(other),self.values.shape))
+
+  def __abs__(self):
+    """
+    Returns the length N array of L2 norms.
+    """
+    return np.sqrt(self.dot(self))
+
+  def norm(self):
+    """
+    Returns the length N array of L2 norms.
+    """
+    return abs(self)
+
+  def copy(self):
+    """
+    Returns a duplicate object with the same values but a separate array.
+    """
+    return self.__class__(self.values.copy())
+
+class Cartesian3DVectorArray(CoordinateVectorArray):
+  """
+  N standard x, y, z vectors.
+  """
+
+  order = ["x","y","z"]
+  vector_class = Cartesian3DVector
+
+  def cross(self,other):
+    """
+    Returns the cross products as a Cartesian3DVectorArray.
+    """
+    if isinstance(other,CoordinateVectorArray) and not isinstance(other,Cartesian3DVectorArray):
+      raise CoordinateException("The cross product is only defined between cartesian vectors.")
+    return Cartesian3DVectorArray(np.cross(self.values,np.broadcast_to(self.asOperand(other),self.values.shape)))
+
+  def getRho(self):
+    """
+    Returns the transverse radius sqrt(x**2 + y**2) of each vector.
+    """
+    return np.hypot(self.values[:,0],self.values[:,1])
+
+  def getPhi(self):
+    """
+    Returns the azimuthal angle of each vector in (-pi,pi].
+    """
+    return np.arctan2(self.values[:,1],self.values[:,0])
+
+  def convertToCylindrical(self):
+    """
+    Returns the cylindrical rho, phi, z vectors that correspond to the same
+    x, y, and z values.
+    """
+    return Cylindrical3DVectorArray(rho=self.getRho(),phi=self.getPhi(),z=self.values[:,2])
+
+  def convertToSpherical(self):
+    """
+    Returns the spherical r, phi, theta vectors that correspond to the same
+    x, y, and z values.  Vectors at the origin get theta = 0.
+    """
+    r = abs(self)
+    cos_theta = np.divide(self.values[:,2],r,out=np.ones_like(r),where=r!=0)
+    return Spherical3DVectorArray(r=r,phi=self.getPhi(),theta=np.arccos(np.clip(cos_theta,-1.,1.)))
+
+  def getAzimuthalComponent(self,other):
+    """
+    Returns the component of other along the azimuthal direction of these
+    position vectors, e.g. the azimuthal momentum p_phi of each particle.
+    Vectors on the axis get 0.
+    """
+    rho = self.getRho()
+    other_values = np.broadcast_to(self.asOperand(other),self.values.shape)
+    numerator = self.values[:,0]*other_values[:,1] - self.values[:,1]*other_values[:,0]
+    return np.divide(numerator,rho,out=np.zeros_like(rho),where=rho!=0)
+
+  def getRadialComponent(self,other):
+    """
+    Returns the component of other along the transverse radial direction of
+    these position vectors.  Vectors on the axis get 0.
+    """
+    rho = self.getRho()
+    other_values = np.broadcast_to(self.asOperand(other),self.values.shape)
+    numerator = self.values[:,0]*other_values[:,0] + self.values[:,1]*other_values[:,1]
+    return np.divide(numerator,rho,out=np.zeros_like(rho),where=rho!=0)
+
+class Cylindrical3DVectorArray(CoordinateVectorArray):
+  """
+  N standard rho, phi, z vectors.
+  """
+
+  order = ["rho","phi","z"]
+  vector_class = Cylindrical3DVector
+
+  def convertToCartesian(self):
+    """
+    Returns the cartesian x, y, z vectors that correspond to the same
+    rho, phi, and z values.
+    """
+    rho, phi, z = self.values.T
+    return Cartesian3DVectorArray(x=rho*np.cos(phi),y=rho*np.sin(phi),z=z)
+
+  def convertToSpherical(self):
+    """
+    Returns the spherical r, phi, theta vectors that correspond to the same
+    rho, phi, and z values.
+    """
+    rho, phi, z = self.values.T
+    r = np.hypot(rho,z)
+    cos_theta = np.divide(z,r,out=np.ones_like(r),where=r!=0)
+    return Spherical3DVectorArray(r=r,phi=phi,theta=np.arccos(np.clip(cos_theta,-1.,1.)))
+
+class Spherical3DVectorArray(CoordinateVectorArray):
+  """
+  N standard r, phi, and theta vectors.
+  """
+
+  order = ["r","phi","theta"]
+  vector_class = Spherical3DVector
+
+  def convertToCartesian(self):
+    """
+    Returns the cartesian x, y, z vectors that correspond to the same
+    r, phi, and theta values.
+    """
+    r, phi, theta = self.values.T
+    sin_theta = np.sin(theta)
+    return Cartesian3DVectorArray(x=r*np.cos(phi)*sin_theta,y=r*np.sin(phi)*sin_theta,z=r*np.cos(theta))
+
+  def convertToCylindrical(self):
+    """
+    Returns the cylindrical rho, phi, z vectors that correspond to the same
+    r, phi, and theta values.
+    """
+    r, phi, theta = self.values.T
+    return Cylindrical3DVectorArray(rho=r*np.sin(theta),phi=phi,z=r*np.cos(theta))
@@ -0,0 +1,125 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import re
+import numpy as np
+from scipy import constants
+from coordinates.kinematics import energy_from_momentum
+from coordinates.my_covariance_matrix import CovarianceAccumulator, covariance_order
+from coordinates.my_covariance_matrix import get_normalized_emittances
+from coordinates.phase_volume_io import read_phase_volume_file_chunks
+
+"""
+Map-reduce over a directory of step-warp_uem.txt (or .npy) phase volume
+dumps: every file is streamed through a CovarianceAccumulator in a worker
+process, and the per-file moments are collected into a time series of
+covariance matrices, rms sizes, normalized emittances and energy spread.
+"""
+
+dump_filename_pattern = re.compile(r"^(\d+)-warp_uem\.(txt|npy)$")
+
+def find_dump_files(directory):
+  """
+  Returns the list of (step, filepath) of the dump files in the directory
+  sorted by step.  When both a .txt and a .npy dump exist for a step, the
+  .npy file is used.
+  """
+  files = {}
+  for filepath in glob.glob(os.path.join(directory,"*-warp_uem.*")):
+    match = dump_filename_pattern.match(os.path.basename(filepath))
+    if match is None:
+      continue
+    step = int(match.group(1))
+    if step not in files or match.group(2) == "npy":
+      files[step] = filepath
+  return sorted(files.items())
+
+def accumulate_dump_file(arguments):
+  """
+  Worker function: streams one dump file through a CovarianceAccumulator.
+  Args:
+    arguments: The tuple (step, filepath, mass, chunk_bytes) so that the
+      function can be mapped over a process pool.
+  Return value:
+    (step, accumulator)
+  """
+  step, filepath, mass, chunk_bytes = arguments
+  accumulator = CovarianceAccumulator()
+  for columns in read_phase_volume_file_chunks(filepath,chunk_bytes=chunk_bytes):
+    columns["E"] = energy_from_momentum(columns["px"],columns["py"],columns["pz"],mass)
+    accumulator.addChunk(np.vstack([columns[o] for o in covariance_order]))
+  return (step, accumulator)
+
+def calc_emittance_history(dump_files,mass,number_of_workers=1,chunk_bytes=2**24):
+  """
+  Computes the moments of every dump file, in parallel when number_of_workers
+  is more than 1, and returns the time series as a dict of numpy arrays.
+  Args:
+    dump_files: A list of (step, filepath) as returned by find_dump_files.
+    mass: The mass of the macroparticle in kg used for the momenta.
+    number_of_workers: The number of processes in the pool.
+    chunk_bytes: The approximate size of text parsed at once by each worker.
+  Return value:
+    A dict with the keys steps, counts, means (nsteps,7), covariances
+    (nsteps,7,7), sigma_x, sigma_y, sigma_z, sigma_E, emittance_nx,
+    emittance_ny, emittance_nz and emittance_n6D.
+  """
+  tasks = [(step, filepath, mass, chunk_bytes) for step, filepath in dump_files]
+  if number_of_workers > 1:
+    pool = multiprocessing.Pool(number_of_workers)
+    try:
+      results = pool.map(accumulate_dump_file,tasks,chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    results = [accumulate_dump_file(task) for task in tasks]
+  results.sort(key=lambda result: result[0])
+
+  output = {}
+  output["steps"] = np.array([step for step, accumulator in results],dtype=np.int64)
+  output["counts"] = np.array([accumulator.n for step, accumulator in results],dtype=np.int64)
+  output["means"] = np.array([accumulator.mean for step, accumulator in results])
+  output["covariances"] = np.array([accumulator.getCovarianceMatrix().getCovarianceMatrix()
+                                    if accumulator.n > 1 else np.full((7,7),np.nan)
+                                    for step, accumulator in results])
+  for name in ["x","y","z","E"]:
+    index = covariance_order.index(name)
+    output["sigma_"+name] = np.sqrt(output["covariances"][:,index,index])
+  for name, emittance in get_normalized_emittances(output["covariances"],mass).iteritems():
+    output["emittance_n"+name] = emittance
+  return output
+
+def write_emittance_history(history,filepath):
+  """
+  Writes the time series to one file: a compressed .npz with every array
+  if the filepath ends with .npz, otherwise an ascii table of the scalar
+  columns with a header line.
+  """
+  if filepath.endswith(".npz"):
+    np.savez_compressed(filepath,**history)
+    return
+  names = ["steps","counts","sigma_x","sigma_y","sigma_z","sigma_E",
+           "emittance_nx","emittance_ny","emittance_nz","emittance_n6D"]
+  table = np.column_stack([history[name] for name in names])
+  np.savetxt(filepath,table,header=" ".join(names),comments="")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Computes the covariance, rms size, emittance and energy spread time series of a directory of step-warp_uem.txt or .npy phase volume dumps using a process pool.')
+  parser.add_argument('dump_directory', type=str, help='The directory containing the phase volume dumps.')
+  parser.add_argument('-o','--output', dest="output", type=str, help='The output file.  A .npz extension stores every array, anything else writes an ascii table.  Defaults to emittance_history.npz in the dump directory.', default=None)
+  parser.add_argument('-w','--workers', dest="workers", type=int, help='The number of worker processes.  Defaults to the number of cpus.', default=multiprocessing.cpu_count())
+  parser.add_argument('-m','--number_of_electrons_per_macroparticle', dest="number_of_electrons_per_macroparticle", type=float, help='The number of electrons per macroparticle for the simulation.  This defaults to 100 unless specified.', default=100.)
+  args = parser.parse_args()
+
+  mass_of_macroparticle = args.number_of_electrons_per_macroparticle*constants.m_e
+  dump_files = find_dump_files(args.dump_directory)
+  if len(dump_files) == 0:
+    raise Exception("No step-warp_uem.txt or .npy files found in " + args.dump_directory + ".")
+  history = calc_emittance_history(dump_files,mass_of_macroparticle,args.workers)
+  output = args.output
+  if output is None:
+    output = os.path.join(args.dump_directory,"emittance_history.npz")
+  write_emittance_history(history,output)
+  print "Wrote " + str(len(dump_files)) + " steps to " + output
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy import constants
+
+"""
+Relativistic conversions between momentum, velocity, Lorentz gamma,
+energy and normalized momentum (u = gamma*v = p/m, Warp's ux, uy, uz).
+Every function works on scalars or numpy arrays of any matching shape.
+The physical constants are looked up once, at import.
+"""
+
+speed_light = constants.physical_constants["speed of light in vacuum"][0]#m/sec by default
+speed_light_squared = speed_light**2
+
+def momentum_squared(px,py,pz):
+  """
+  Returns |p|**2.
+  """
+  return px*px + py*py + pz*pz
+
+def lorentz_gamma_from_momentum(px,py,pz,mass):
+  """
+  Returns gamma = sqrt(1 + |p|**2/(m c)**2).
+  """
+  return np.sqrt(1. + momentum_squared(px,py,pz)/(mass*speed_light)**2)
+
+def lorentz_gamma_from_velocity(vx,vy,vz):
+  """
+  Returns gamma = 1/sqrt(1 - |v|**2/c**2).
+  """
+  return 1./inverse_lorentz_gamma_from_velocity(vx,vy,vz)
+
+def inverse_lorentz_gamma_from_velocity(vx,vy,vz):
+  """
+  Returns 1/gamma = sqrt(1 - |v|**2/c**2).
+  """
+  return np.sqrt(1. - momentum_squared(vx,vy,vz)/speed_light_squared)
+
+def lorentz_gamma_from_normalized_momentum(ux,uy,uz):
+  """
+  Returns gamma = sqrt(1 + |u|**2/c**2) for u = gamma*v.
+  """
+  return np.sqrt(1. + momentum_squared(ux,uy,uz)/speed_light_squared)
+
+def inverse_lorentz_gamma_from_normalized_momentum(ux,uy,uz):
+  """
+  Returns 1/gamma for u = gamma*v, the gi Warp expects with ux, uy, uz.
+  """
+  return 1./lorentz_gamma_from_normalized_momentum(ux,uy,uz)
+
+def velocity_from_momentum(px,py,pz,mass):
+  """
+  Returns (vx,vy,vz) = p/(gamma m).
+  """
+  scale = 1./(lorentz_gamma_from_momentum(px,py,pz,mass)*mass)
+  return (px*scale, py*scale, pz*scale)
+
+def momentum_from_velocity(vx,vy,vz,mass):
+  """
+  Returns (px,py,pz) = gamma m v.
+  """
+  scale = lorentz_gamma_from_velocity(vx,vy,vz)*mass
+  return (vx*scale, vy*scale, vz*scale)
+
+def normalized_momentum_from_momentum(px,py,pz,mass):
+  """
+  Returns (ux,uy,uz) = p/m.
+  """
+  return (px/mass, py/mass, pz/mass)
+
+def momentum_from_normalized_momentum(ux,uy,uz,mass):
+  """
+  Returns (px,py,pz) = m u.
+  """
+  return (ux*mass, uy*mass, uz*mass)
+
+def velocity_from_normalized_momentum(ux,uy,uz):
+  """
+  Returns (vx,vy,vz) = u/gamma.
+  """
+  inverse_gamma = inverse_lorentz_gamma_from_normalized_momentum(ux,uy,uz)
+  return (ux*inverse_gamma, uy*inverse_gamma, uz*inverse_gamma)
+
+def energy_from_momentum(px,py,pz,mass):
+  """
+  Returns the total energy c*sqrt(|p|**2 + (m c)**2) in J.
+  """
+  return speed_light*np.sqrt(momentum_squared(px,py,pz) + (mass*speed_light)**2)
+
+def kinetic_energy_from_momentum(px,py,pz,mass):
+  """
+  Returns the kinetic energy (gamma - 1) m c**2 in J, written so that it
+  stays accurate in the nonrelativistic limit.
+  """
+  psq = momentum_squared(px,py,pz)
+  rest_energy = mass*speed_light_squared
+  return psq*speed_light_squared/(energy_from_momentum(px,py,pz,mass) + rest_energy)
@@ -0,0 +1,102 @@
+import itertools
+import numpy as np
+
+class MomentEngine():
+  """
+  Computes means of products of phase volume fields (e.g. <x x>, <x px>,
+  <z pz E>) from the column arrays of a Phase6DVolume.  Every product
+  is built from a shorter, already stored product, so shared sub-products
+  are only multiplied out once.  The products are only stored while a
+  batch of means is evaluated; the means are kept.
+  """
+
+  def __init__(self,phase_volume,central=False):
+    """
+    Stores the phase volume and sets up the product and mean caches.
+    If central is True, every field has its mean removed before the
+    products are formed so that the moments are central moments.
+    """
+    self.phase_volume = phase_volume
+    self.central = central
+    self.products = {}
+    self.means = {}
+
+  def getKey(self,fieldnames):
+    """
+    Returns the cache key for the product of the fieldnames.  Products
+    commute, so the key is the sorted tuple of the fieldnames.
+    """
+    return tuple(sorted(fieldnames))
+
+  def getProduct(self,key):
+    """
+    Returns the array of the product over the fields in key for every
+    particle, reusing the product of all but the last field.
+    """
+    if key not in self.products:
+      if len(key) == 1:
+        column = np.asarray(self.phase_volume.getArrayFromFieldname(key[0]),dtype=np.float64)
+        if self.central:
+          column = column - column.mean()
+        self.products[key] = column
+      else:
+        self.products[key] = self.getProduct(key[:-1])*self.getProduct(key[-1:])
+    return self.products[key]
+
+  def getMean(self,fieldnames):
+    """
+    Returns the mean (with 1/N) of the product of the fieldnames across
+    the ensemble.  The mean of the empty product is 1.
+    """
+    return self.getMeans([fieldnames])[0]
+
+  def getMeans(self,list_of_fieldnames):
+    """
+    Returns a numpy array with the mean of each of the requested products.
+    The products are evaluated in lexicographic order of their keys, so
+    every product is followed by the ones extending it.  After each mean
+    only the products that are a prefix of the next key are kept, which
+    bounds the stored products by the fields plus one chain of prefixes.
+    """
+    keys = [self.getKey(fieldnames) for fieldnames in list_of_fieldnames]
+    pending = sorted(set([key for key in keys if key not in self.means]))
+    for index, key in enumerate(pending):
+      if len(key) == 0:
+        self.means[key] = 1.
+      else:
+        self.means[key] = self.getProduct(key).sum()/len(self.phase_volume)
+      if index + 1 < len(pending):
+        self.releaseProducts(pending[index+1])
+    self.clear()
+    return np.array([self.means[key] for key in keys])
+
+  def getMomentTensor(self,fieldnames,order):
+    """
+    Returns the symmetric tensor T with T[i,j,...] = <f_i f_j ...> for the
+    fields in fieldnames and the given order (number of indices).  Only the
+    unique index combinations are evaluated, in one batch.
+    """
+    n = len(fieldnames)
+    tensor = np.empty((n,)*order)
+    combinations = list(itertools.combinations_with_replacement(range(n),order))
+    values = self.getMeans([[fieldnames[i] for i in combination] for combination in combinations])
+    for combination, value in zip(combinations,values):
+      for permutation in set(itertools.permutations(combination)):
+        tensor[permutation] = value
+    return tensor
+
+  def releaseProducts(self,next_key):
+    """
+    Drops the stored products of two or more fields that are not a
+    prefix of next_key.
+    """
+    for key in self.products.keys():
+      if len(key) > 1 and key != next_key[:len(key)]:
+        del self.products[key]
+
+  def clear(self):
+    """
+    Drops the stored products (which hold one array per product) while
+    keeping the means already computed.
+    """
+    self.products = {}
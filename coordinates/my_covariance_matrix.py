@@ -1,5 +1,7 @@
 import numpy as np
 from scipy import constants
+from coordinates.coordinate_vector import CoordinateException
+from coordinates.kinematics import speed_light
 
 class MyCovarianceMatrix():
   """
@@ -7,8 +9,17 @@ class MyCovarianceMatrix():
   covariance matrix.
   """
 
-  def __init__(self,phase_volume):
-    self.cov_matrix = self.calcCovarianceMatrix(phase_volume)
+  def __init__(self,phase_volume=None,cov_matrix=None):
+    """
+    Calculates the covariance matrix from the phase volume or, if
+    the phase volume is not given, stores the provided 7 x 7 cov_matrix.
+    """
+    if phase_volume is not None:
+      self.cov_matrix = self.calcCovarianceMatrix(phase_volume)
+    elif cov_matrix is not None:
+      self.cov_matrix = np.array(cov_matrix,dtype=np.float64)
+    else:
+      raise CoordinateException("Either a phase volume or a covariance matrix is needed.")
 
   def __len__(self):
     return self.cov_matrix.size
@@ -24,18 +35,8 @@ class MyCovarianceMatrix():
     """
     Uses numpy to calculate the 7 x 7 covariance matrix.
     """
-    input_array = []
-    for particle in phase_volume:
-      row = []
-      row.append(particle.x.x)
-      row.append(particle.x.y)
-      row.append(particle.x.z)
-      row.append(particle.p.x)
-      row.append(particle.p.y)
-      row.append(particle.p.z)
-      row.append(particle.getEnergy())
-      input_array.append(row)
-    input_array = np.array(input_array).T #Transpose
+    order = ["x", "y", "z", "px", "py", "pz", "E"]
+    input_array = np.vstack([phase_volume.getArrayFromFieldname(o) for o in order])
     return np.cov(input_array)
 
   def getCovarianceElement(self,first_variable,second_variable):
@@ -141,6 +142,66 @@ class MyCovarianceMatrix():
       self.sub_determinant[subkey] = sign * np.exp(logdet)
     return self.sub_determinant[subkey]
     
+covariance_order = ["x","y","z","px","py","pz","E"]
+emittance_planes = {"x": ["x","px"], "y": ["y","py"], "z": ["z","pz"],
+                    "6D": ["x","y","z","px","py","pz"]}
+
+def stack_covariance_matrices(covariance_matrices):
+  """
+  Returns an (nsteps,7,7) array from a list of MyCovarianceMatrix objects
+  (or 7 x 7 arrays).
+  """
+  return np.array([getattr(c,"cov_matrix",c) for c in covariance_matrices],dtype=np.float64)
+
+def get_sub_determinants(cov_matrices,planes=emittance_planes):
+  """
+  Returns the determinants of the sub matrices given by planes for every
+  matrix of an (nsteps,7,7) stack.  All planes with the same size go through
+  a single batched slogdet.
+  Args:
+    cov_matrices: An (nsteps,7,7) array or a list of MyCovarianceMatrix objects.
+    planes: A dict of plane name to the list of elements of the sub matrix.
+      Defaults to the x, y, z and 6D phase planes.
+  Return value:
+    A dict of plane name to the length nsteps array of determinants.
+  """
+  cov_matrices = stack_covariance_matrices(cov_matrices)
+  if cov_matrices.ndim == 2:
+    cov_matrices = cov_matrices[np.newaxis]
+  names_by_size = {}
+  for name, subelements in planes.iteritems():
+    names_by_size.setdefault(len(subelements),[]).append(name)
+  output = {}
+  for size, names in names_by_size.iteritems():
+    submatrices = []
+    for name in names:
+      indices = np.array([covariance_order.index(e) for e in planes[name]],dtype=np.intp)
+      submatrices.append(cov_matrices[:,indices[:,np.newaxis],indices])
+    sign, logdet = np.linalg.slogdet(np.concatenate(submatrices,axis=0))
+    determinants = (sign*np.exp(logdet)).reshape(len(names),-1)
+    for i, name in enumerate(names):
+      output[name] = determinants[i]
+  return output
+
+def get_normalized_emittances(cov_matrices,mass,planes=emittance_planes):
+  """
+  Returns the normalized rms emittances of every matrix of an (nsteps,7,7)
+  stack.  A plane of 2n elements gives det**(1/2)/(m c)**n, so the x, y and
+  z planes are in m rad.  Negative determinants (round off) give nan.
+  Args:
+    cov_matrices: An (nsteps,7,7) array or a list of MyCovarianceMatrix objects.
+    mass: The mass of the (macro)particle in kg used for the momenta.
+  Return value:
+    A dict of plane name to the length nsteps array of emittances.
+  """
+  determinants = get_sub_determinants(cov_matrices,planes)
+  output = {}
+  for name, determinant in determinants.iteritems():
+    n = len(planes[name])/2
+    with np.errstate(invalid="ignore"):
+      output[name] = np.sqrt(determinant)/(mass*speed_light)**n
+  return output
+
 class MyEditableCovarianceMatrix(MyCovarianceMatrix):
   """
   An object to provide how I like to interact with the x,y,z,px,py,pz,E
@@ -166,4 +227,73 @@ class MyEditableCovarianceMatrix(MyCovarianceMatrix):
     second_index = order.index(second_variable)
     self.cov_matrix[first_index,second_index] = value
 
+class CovarianceAccumulator():
+  """
+  Accumulates the x,y,z,px,py,pz,E covariance matrix chunk by chunk
+  using the pairwise update of Chan et al., so the whole ensemble never
+  has to be in memory.  Accumulators built from different files or
+  processes can be merged exactly.
+  """
 
+  order = ["x", "y", "z", "px", "py", "pz", "E"]
+
+  def __init__(self):
+    """
+    Starts with no particles.  The state is the count, the 7 means and
+    the 7 x 7 matrix of summed products of deviations from the mean.
+    """
+    self.n = 0
+    self.mean = np.zeros(len(self.order))
+    self.comoment = np.zeros((len(self.order),len(self.order)))
+
+  def __len__(self):
+    return self.n
+
+  def addChunk(self,chunk):
+    """
+    Adds a chunk of particles given as a 7 x k array with the rows in
+    the order x, y, z, px, py, pz, E.
+    """
+    chunk = np.asarray(chunk,dtype=np.float64)
+    if chunk.ndim != 2 or chunk.shape[0] != len(self.order):
+      raise CoordinateException("Chunks must be arrays of shape (7,k) ordered as " + ", ".join(self.order))
+    k = chunk.shape[1]
+    if k == 0:
+      return
+    chunk_mean = chunk.mean(axis=1)
+    deviations = chunk - chunk_mean[:,np.newaxis]
+    self.combine(k,chunk_mean,np.dot(deviations,deviations.T))
+
+  def addPhaseVolume(self,phase_volume):
+    """
+    Adds all of the particles of a Phase6DVolume as one chunk.
+    """
+    self.addChunk(np.vstack([phase_volume.getArrayFromFieldname(o) for o in self.order]))
+
+  def merge(self,other):
+    """
+    Merges another accumulator into this one.  The result is the same
+    as if all particles had been added to a single accumulator.
+    """
+    if other.n == 0:
+      return
+    self.combine(other.n,other.mean,other.comoment)
+
+  def combine(self,n,mean,comoment):
+    """
+    Combines the stored statistics with those of another set of n particles.
+    """
+    total = self.n + n
+    delta = mean - self.mean
+    self.comoment = self.comoment + comoment + np.outer(delta,delta)*(float(self.n)*n/total)
+    self.mean = self.mean + delta*(float(n)/total)
+    self.n = total
+
+  def getCovarianceMatrix(self):
+    """
+    Returns the accumulated covariance as a MyCovarianceMatrix.  Like
+    np.cov, the normalization is 1/(N-1).
+    """
+    if self.n < 2:
+      raise CoordinateException("At least two particles are needed for a covariance matrix.")
+    return MyCovarianceMatrix(cov_matrix=self.comoment/(self.n-1))
@@ -1,13 +1,16 @@
 import math
-from scipy import constants
 from coordinates.coordinate_vector import CoordinateException
 from coordinates.coordinate_vector_3d import Cartesian3DVector
+from coordinates import kinematics
+from coordinates.kinematics import speed_light
 
-class ParticlePhaseCoordinates():
+class ParticlePhaseCoordinates(object):
   """
   The phase coordinates for a particle in 6D.
   """
 
+  __slots__ = ("x","p","v","mass","energy")
+
   def __init__(self,mass,x=None,p=None,v=None):
     """
     Uses the two input Cartesian3DVectors or 0,0,0 for each to define the
@@ -52,7 +55,7 @@ class ParticlePhaseCoordinates():
       if isinstance(p,Cartesian3DVector):
         self.p = Cartesian3DVector(p.x,p.y,p.z)
       else:
-        raise CoordinateVector("Initializing a particle with the incorrect momentum vector type.")
+        raise CoordinateException("Initializing a particle with the incorrect momentum vector type.")
   
   def getMomentum(self):
     """
@@ -82,7 +85,7 @@ class ParticlePhaseCoordinates():
       if isinstance(v,Cartesian3DVector):
         self.v = Cartesian3DVector(v.x,v.y,v.z)
       else:
-        raise CoordinateVector("Initializing a particle with the incorrect velocity vector type.")
+        raise CoordinateException("Initializing a particle with the incorrect velocity vector type.")
 
   def getVelocity(self):
     """
@@ -95,12 +98,8 @@ class ParticlePhaseCoordinates():
     Calculates the cartesian 3d vector of velocity from the momentum and mass of the particle.
     """
     if self.mass is None:
-      raise CoordinateVector("The particle mass needs to be specified to calculate the particle velocity from momentum.")
-    values = {}
-    for direction in self.p.order:
-      gamma = self.calcLorentzGammaFromMomentum(direction)
-      values[direction] = getattr(self.p,direction)/(gamma*self.mass)
-    self.setVelocity(Cartesian3DVector(**values))
+      raise CoordinateException("The particle mass needs to be specified to calculate the particle velocity from momentum.")
+    self.setVelocity(Cartesian3DVector(*kinematics.velocity_from_momentum(self.p.x,self.p.y,self.p.z,self.mass)))
     return self.getVelocity()
 
   def calcMomentumFromVelocity(self):
@@ -108,32 +107,32 @@ class ParticlePhaseCoordinates():
     Calculates the cartesian 3d vector of momentum from the velocity and mass of the particle.
     """
     if self.mass is None:
-      raise CoordinateVector("The particle mass needs to be specified to calculate the particle momentum from velocity.")
-    values = {}
-    for direction in self.v.order:
-      gamma = self.calcLorentzGammaFromVelocity(direction)
-      values[direction] = getattr(self.v,direction)*gamma*self.mass
-    self.setMomentum(Cartesian3DVector(**values))
+      raise CoordinateException("The particle mass needs to be specified to calculate the particle momentum from velocity.")
+    self.setMomentum(Cartesian3DVector(*kinematics.momentum_from_velocity(self.v.x,self.v.y,self.v.z,self.mass)))
     return self.getMomentum()
 
-  def calcLorentzGammaFromMomentum(self,direction):
+  def calcLorentzGammaFromMomentum(self,direction=None):
     """
-    Calculates the lorenzt gamma in the provided direction from the momentum and mass of the particle.
+    Calculates the lorenzt gamma from the momentum and mass of the particle.  If a direction
+    is given, only the momentum in that direction is used.
     """
     if self.mass is None:
-      raise CoordinateVector("The particle mass needs to be specified to calculate the lorentz gamma.")
+      raise CoordinateException("The particle mass needs to be specified to calculate the lorentz gamma.")
+    if direction is None:
+      return kinematics.lorentz_gamma_from_momentum(self.p.x,self.p.y,self.p.z,self.mass)
     if direction not in self.x.order:   
-      raise CoordinateVector("The direction, "+str(direction)+ " needs to be one of " +",".join(self.x.order) + " to calculated the lorentz gamma.")
-    speed_light = constants.physical_constants["speed of light in vacuum"][0]#m/sec by default
+      raise CoordinateException("The direction, "+str(direction)+ " needs to be one of " +",".join(self.x.order) + " to calculated the lorentz gamma.")
     return math.sqrt(1 + (getattr(self.p,direction)/(self.mass*speed_light))**2)
 
-  def calcLorentzGammaFromVelocity(self,direction):
+  def calcLorentzGammaFromVelocity(self,direction=None):
     """
-    Calculates the lorenzt gamma in the provided direction from the velocity of the particle expressed as a fraction of c.
+    Calculates the lorenzt gamma from the velocity of the particle.  If a direction
+    is given, only the velocity in that direction is used.
     """
+    if direction is None:
+      return kinematics.lorentz_gamma_from_velocity(self.v.x,self.v.y,self.v.z)
     if direction not in self.v.order:   
-      raise CoordinateVector("The direction, "+str(direction)+ " needs to be one of " +",".join(self.x.order) + " to calculated the lorentz gamma.")
-    speed_light = constants.physical_constants["speed of light in vacuum"][0]#m/sec by default
+      raise CoordinateException("The direction, "+str(direction)+ " needs to be one of " +",".join(self.x.order) + " to calculated the lorentz gamma.")
     return math.sqrt(1 /(1 - (getattr(self.v,direction)/speed_light)**2))
 
   def advancePosition(self,time):
@@ -172,10 +171,9 @@ class ParticlePhaseCoordinates():
     """
     Calculates the energy of the particle in J.
     """
-    speed_light = constants.physical_constants["speed of light in vacuum"][0]#m/sec by default
     if self.mass is None:
-      raise CoordinateVector("The particle mass needs to be specified to calculate the energy.")
-    return speed_light*math.sqrt(self.p*self.p + (self.mass*speed_light)**2)
+      raise CoordinateException("The particle mass needs to be specified to calculate the energy.")
+    return kinematics.energy_from_momentum(self.p.x,self.p.y,self.p.z,self.mass)
 
   def getValueFromFieldname(self,fieldname):
     """
@@ -214,6 +212,8 @@ class TimedParticlePhaseCoordinates(ParticlePhaseCoordinates):
   and methods associated with tis attribute.
   """
 
+  __slots__ = ("time",)
+
   def __init__(self,mass,time,**kwargs):
     """
     Adds the time to the object and then passes control back to ParticlePhaseCoordinates()
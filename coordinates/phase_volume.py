@@ -1,31 +1,62 @@
 import argparse
 import math
 import pickle
+import numpy as np
 from scipy import constants
 from coordinates.coordinate_vector import CoordinateException
 from coordinates.coordinate_vector_3d import Cartesian3DVector
+from coordinates.coordinate_vector_3d_array import Cartesian3DVectorArray
+from coordinates import kinematics
+from coordinates.moment_engine import MomentEngine
 from coordinates.my_covariance_matrix import MyCovarianceMatrix
+from coordinates.phase_volume_io import read_phase_volume_chunks
 from coordinates.particle_coordinates import ParticlePhaseCoordinates, TimedParticlePhaseCoordinates
 
 class Phase6DVolume():
   """
-  An ensemble of 3D position and 3D momentum vectors.
+  An ensemble of 3D position and 3D momentum vectors stored as
+  contiguous float64 columns (one row of self.data per coordinate).
   """
 
-  def __init__(self,particle_type=ParticlePhaseCoordinates):
+  column_order = ["x","y","z","px","py","pz","t","mass"]
+
+  def __init__(self,particle_type=ParticlePhaseCoordinates,capacity=0):
     """
-    Initializes the phase volume to an empty list and sets the
+    Initializes the phase volume to empty columns and sets the
     attribute type.  Type will determine what type of particles
-    to include.
+    are returned when iterating over the volume.  Capacity preallocates
+    room for that many particles.
     """
-    self.particles = []
     particle_type_options = [ParticlePhaseCoordinates, TimedParticlePhaseCoordinates]
     if particle_type not in particle_type_options:
-      raise CoordinateException("The only particle options for Phase6DVolume are: " + " ".join(particle_type_options))
+      raise CoordinateException("The only particle options for Phase6DVolume are: " + " ".join([p.__name__ for p in particle_type_options]))
     self.particle_type = particle_type
+    self.data = np.zeros((len(self.column_order),int(capacity)))
+    self.number_of_particles = 0
 
   def __len__(self):
-    return len(self.particles)
+    return self.number_of_particles
+
+  def reserve(self,capacity):
+    """
+    Makes sure the columns can hold at least capacity particles without
+    reallocating.  Growth is geometric so that repeated appends are amortized O(1).
+    """
+    current_capacity = self.data.shape[1]
+    if capacity <= current_capacity:
+      return
+    new_capacity = max(int(capacity),2*current_capacity,16)
+    new_data = np.zeros((len(self.column_order),new_capacity))
+    new_data[:,:self.number_of_particles] = self.data[:,:self.number_of_particles]
+    self.data = new_data
+
+  def clearCache(self):
+    """
+    Removes any stored means or covariance matrix since the particles changed.
+    """
+    for attr in ["moment_engine","central_moment_engine","cov_matrix"]:
+      if hasattr(self,attr):
+        delattr(self,attr)
 
   def addParticle(self,mass,*args,**kwargs):
     """
@@ -33,28 +64,111 @@ class Phase6DVolume():
     is initialized with the cartesian coordinates x and p.
     """
     if isinstance(mass,self.particle_type): #Mass is actually the particle here.
-      self.particles.append(mass)
+      particle = mass
     else:
       particle = self.particle_type(mass,*args,**kwargs)
-      self.particles.append(particle)
+    time = getattr(particle,"time",0.)
+    self.reserve(self.number_of_particles+1)
+    self.data[:,self.number_of_particles] = [particle.x.x, particle.x.y, particle.x.z,
+                                             particle.p.x, particle.p.y, particle.p.z,
+                                             time, particle.mass]
+    self.number_of_particles += 1
+    self.clearCache()
+
+  def addParticles(self,mass,x,y,z,px,py,pz,t=0.):
+    """
+    Appends a whole set of particles given as arrays (or scalars broadcast
+    to the arrays' length) in a single copy.
+    """
+    columns = np.broadcast_arrays(*[np.asarray(c,dtype=np.float64) for c in [x,y,z,px,py,pz,t,mass]])
+    n = columns[0].size
+    self.reserve(self.number_of_particles+n)
+    for i, column in enumerate(columns):
+      self.data[i,self.number_of_particles:self.number_of_particles+n] = column.ravel()
+    self.number_of_particles += n
+    self.clearCache()
+
+  def getColumn(self,name):
+    """
+    Returns a view of the stored column with the given name.
+    """
+    if name == "time":
+      name = "t"
+    return self.data[self.column_order.index(name),:self.number_of_particles]
+
+  def getArrayFromFieldname(self,fieldname):
+    """
+    Returns a numpy array of the fieldname across the ensemble.  Supports the
+    same names as ParticlePhaseCoordinates.getValueFromFieldname as well as
+    ux, uy, uz (normalized momentum), gamma and KE (kinetic energy).
+    """
+    if fieldname in self.column_order or fieldname == "time":
+      return self.getColumn(fieldname)
+    if fieldname == "E": #Interprets E as energy
+      return self.calcEnergy()
+    momentum = [self.getColumn(c) for c in ["px","py","pz"]]
+    mass = self.getColumn("mass")
+    if fieldname in ["vx","vy","vz"]:
+      return kinematics.velocity_from_momentum(*(momentum+[mass]))["xyz".index(fieldname[1])]
+    if fieldname in ["ux","uy","uz"]:
+      return self.getColumn("p"+fieldname[1])/mass
+    if fieldname == "gamma":
+      return kinematics.lorentz_gamma_from_momentum(*(momentum+[mass]))
+    if fieldname == "KE":
+      return kinematics.kinetic_energy_from_momentum(*(momentum+[mass]))
+    raise Exception("The given field, "+fieldname+", is not defined for the particle.")
+
+  def getPositionArray(self):
+    """
+    Returns the positions of all particles as a Cartesian3DVectorArray.
+    """
+    return Cartesian3DVectorArray(self.data[0:3,:self.number_of_particles].T)
+
+  def getMomentumArray(self):
+    """
+    Returns the momenta of all particles as a Cartesian3DVectorArray.
+    """
+    return Cartesian3DVectorArray(self.data[3:6,:self.number_of_particles].T)
+
+  def calcEnergy(self):
+    """
+    Calculates the energy of every particle in J.
+    """
+    return kinematics.energy_from_momentum(self.getColumn("px"),self.getColumn("py"),
+                                           self.getColumn("pz"),self.getColumn("mass"))
 
   def translate(self,translation_vector):
     """
     Translates the phase volume to a new coordinate systems
     and returns the translated phase volume.
     """
+    if not isinstance(translation_vector,Cartesian3DVector):
+      raise CoordinateException("Translating a particle with the incorrect translation vector type.")
     new_phase_volume = self.__class__()
-    for particle in self:
-      new_phase_volume.addParticle(particle.translate(translation_vector))
+    new_phase_volume.data = self.data[:,:self.number_of_particles].copy()
+    new_phase_volume.number_of_particles = self.number_of_particles
+    new_phase_volume.data[0:3] -= np.array(translation_vector.getVector())[:,np.newaxis]
+    new_phase_volume.clearCache() #The copied particles have not been sorted in the new volume.
     return new_phase_volume
 
+  def getParticle(self,index):
+    """
+    Builds the particle object for the particle at index.
+    """
+    x, y, z, px, py, pz, t, mass = self.data[:,index]
+    position = Cartesian3DVector(x,y,z)
+    momentum = Cartesian3DVector(px,py,pz)
+    if self.particle_type is TimedParticlePhaseCoordinates:
+      return self.particle_type(mass,t,x=position,p=momentum)
+    return self.particle_type(mass,x=position,p=momentum)
+
   def __iter__(self):
     """
     Allows the ability to iterate over the particles in
     phase space without referencing the particels themselves.
     """
-    for particle in self.particles:
-      yield particle
+    for i in range(self.number_of_particles):
+      yield self.getParticle(i)
 
   def __str__(self):
     """
@@ -65,45 +179,50 @@ class Phase6DVolume():
       output.append(str(particle))
     return "\n".join(output)
 
-  def injectFile(self,filepath,mass=1,header=False,fieldnames=["x","y","z","px","py","pz"],delimiter=" "):
+  def injectFile(self,filepath,mass=1,header=None,fieldnames=None,delimiter=" ",**kwargs):
     """
     Reads in the file from filepath and extracts the phasespace according to
     the split on the delimiter.  Fieldnames are only used if header is false, otherwise
-    they are derived from the header.  If no fieldname called "mass" is used, the mass of
-    the particle is set to mass.
-    """
-    with open(filepath,'r') as f:
-      for line in f:
-        line = line.rstrip()
-        line = line.lstrip(" ")
-        if header == True:
-          header = False
-          fieldnames = line.split(delimiter)
-          continue
-        pieces = line.split(delimiter)
-        pieces = [p for p in pieces if p != '']
-        if len(pieces) != len(fieldnames):
-          print pieces
-          print fieldnames
-          raise Exception("The format of " + filepath + " is inconsistent.")
-        row = dict(zip(fieldnames,pieces))
-        position = Cartesian3DVector(row["x"],row["y"],row["z"])
-        momentum = Cartesian3DVector(row["px"],row["py"],row["pz"])
-        self.addParticle(mass,x=position,p=momentum)
-        
+    they are derived from the header.  A header of None detects a non-numeric first line,
+    and fieldnames of None are inferred from the number of columns (see
+    coordinates.phase_volume_io).  If no fieldname called "mass" is used, the mass of
+    the particle is set to mass.  The file is parsed in bulk, chunk by chunk.
+    """
+    for columns in read_phase_volume_chunks(filepath,header,fieldnames,delimiter,**kwargs):
+      self.addParticles(columns.get("mass",mass),columns["x"],columns["y"],columns["z"],
+                        columns["px"],columns["py"],columns["pz"],columns.get("t",0.))
+
+  def getMomentEngine(self,central=False):
+    """
+    Returns the moment engine attached to the current particles, creating it
+    if needed.  Central selects the engine working on mean-subtracted fields.
+    """
+    attr = "central_moment_engine" if central else "moment_engine"
+    if not hasattr(self,attr):
+      setattr(self,attr,MomentEngine(self,central=central))
+    return getattr(self,attr)
+
   def getMean(self,fieldnames):
     """
     Checks to see if the mean has already been caclulated.  If so, return
     the previously identified mean.  Otherwise, calculate the mean and store
     if for later retrieval and returning.
     """
-    if not hasattr(self,"means"):
-      self.means = {}
-    sortedfieldnames = sorted(fieldnames)
-    fieldname_key = ",".join(sortedfieldnames)
-    if fieldname_key not in self.means:
-      self.means[fieldname_key] = self.calcMean(fieldnames)
-    return self.means[fieldname_key]
+    return self.getMomentEngine().getMean(fieldnames)
+
+  def getMeans(self,list_of_fieldnames,central=False):
+    """
+    Returns a numpy array of the means of each list of fieldnames, computed
+    in one batched pass sharing the common sub-products.
+    """
+    return self.getMomentEngine(central).getMeans(list_of_fieldnames)
+
+  def getMomentTensor(self,fieldnames,order,central=False):
+    """
+    Returns the symmetric tensor of all moments of the fieldnames up to
+    the given order (number of indices).
+    """
+    return self.getMomentEngine(central).getMomentTensor(fieldnames,order)
 
   def calcMean(self,fieldnames):
     """
@@ -112,13 +231,10 @@ class Phase6DVolume():
     I thought about this, but I think correcting to 1/(N-len(fieldnames)) is not
     appropriate in this instance.
     """
-    total = 0
-    for particle in self:
-      product = 1.
-      for fieldname in fieldnames:
-        product *= particle.getValueFromFieldname(fieldname)
-      total += product
-    return total/len(self)
+    product = np.ones(len(self))
+    for fieldname in fieldnames:
+      product *= self.getArrayFromFieldname(fieldname)
+    return product.sum()/len(self)
 
   def getCovarianceMatrix(self,recalculate=False):
     """
@@ -131,45 +247,99 @@ class Phase6DVolume():
 
   def getListFromFieldname(self, fieldname):
     """
-    Returns a list of all of the fieldname values of the particles.
+    Returns a numpy array of all of the fieldname values of the particles.
     """
-    output = []
-    for particle in self:
-      output.append(particle.getValueFromFieldname(fieldname))
-    return output
+    return self.getArrayFromFieldname(fieldname)
 
 class TimedPhase6DVolume(Phase6DVolume):
   """
   A class to provide the functions we'd like for the timed particles.
+  The columns are kept sorted by time (sorted lazily, the first time
+  a time slice is requested after particles are added) so that time
+  slices are contiguous views found by binary search.
   """
 
-  def __init__(self,particle_type=TimedParticlePhaseCoordinates):
-    Phase6DVolume.__init__(self,particle_type)
+  def __init__(self,particle_type=TimedParticlePhaseCoordinates,**kwargs):
+    Phase6DVolume.__init__(self,particle_type,**kwargs)
+    self.time_sorted = True
 
-  def getTimeSlice(self,min_time,max_time):
+  def clearCache(self):
     """
-    Returns a TimedPhase6DVolume containing all of the particles
-    with time > min_time and less than or equal to max_time.
+    Removes the stored means and covariance matrix and marks the time order as unknown.
+    """
+    Phase6DVolume.clearCache(self)
+    self.time_sorted = False
+
+  def sortByTime(self):
+    """
+    Reorders the particles by time (stable, so equal times keep their order).
+    This is the time index used by getTimeSlice and binByTime.  The sorted
+    columns are a new array, so views handed out before keep their particles.
     """
+    if self.time_sorted:
+      return
+    time = self.getColumn("t")
+    if np.any(time[1:] < time[:-1]):
+      order = np.argsort(time,kind="mergesort")
+      self.data = self.data[:,order]
+    self.clearCache() #Cached products follow the old particle order.
+    self.time_sorted = True
+
+  def getView(self,start,stop):
+    """
+    Returns a TimedPhase6DVolume sharing the columns of particles start to
+    stop.  Writes into the view's columns are seen by this volume.  The view
+    is a snapshot: particles added or sorted later in this volume do not
+    change it.  An empty range, e.g. stop < start, gives an empty view.
+    """
+    stop = max(stop,start)
     new_phase_volume = self.__class__()
-    for particle in self:
-      if particle.time > min_time and particle.time <= max_time:
-        new_phase_volume.addParticle(particle)
+    new_phase_volume.data = self.data[:,start:stop]
+    new_phase_volume.number_of_particles = stop - start
     return new_phase_volume
 
+  def getTimeSlice(self,min_time,max_time):
+    """
+    Returns a TimedPhase6DVolume containing all of the particles
+    with time > min_time and less than or equal to max_time.  The
+    returned volume is a view (see getView) found in O(log N).
+    """
+    self.sortByTime()
+    start, stop = np.searchsorted(self.getColumn("t"),[min_time,max_time],side="right")
+    return self.getView(start,stop)
+
+  def getTimeBinIndices(self,time_edges):
+    """
+    Returns the particle index at each of the sorted time_edges, so that
+    bin i holds particles start[i] to start[i+1] with time in
+    (time_edges[i], time_edges[i+1]].
+    """
+    self.sortByTime()
+    return np.searchsorted(self.getColumn("t"),time_edges,side="right")
+
+  def binByTime(self,time_edges):
+    """
+    Splits the ensemble into the len(time_edges)-1 bins given by the sorted
+    time_edges in a single pass and returns a list of views, one per bin.
+    """
+    boundaries = self.getTimeBinIndices(time_edges)
+    return [self.getView(boundaries[i],boundaries[i+1]) for i in range(len(boundaries)-1)]
+
   def injectPickleDict(self,filepath,mass,position_conversion=1.,momentum_conversion=1.):
     """
     Adds the particles in the pckl dict to the object.
     """
     data_dict = pickle.load( open( filepath, "r" ) )
-    for row in data_dict:
-      position = Cartesian3DVector(row["x"]*position_conversion,
-                                   row["y"]*position_conversion,
-                                   row["z"]*position_conversion)
-      momentum = Cartesian3DVector(row["px"]*momentum_conversion,
-                                   row["py"]*momentum_conversion,
-                                   row["pz"]*momentum_conversion)
-      self.addParticle(mass,row["t"],x=position,p=momentum)
+    columns = {}
+    for key in ["t","x","y","z","px","py","pz"]:
+      columns[key] = np.array([row[key] for row in data_dict],dtype=np.float64)
+    self.addParticles(mass,columns["x"]*position_conversion,
+                      columns["y"]*position_conversion,
+                      columns["z"]*position_conversion,
+                      columns["px"]*momentum_conversion,
+                      columns["py"]*momentum_conversion,
+                      columns["pz"]*momentum_conversion,
+                      columns["t"])
 
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='Test functions in this package and use simple commands to get some of the straightforward methods.')
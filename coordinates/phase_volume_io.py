@@ -0,0 +1,105 @@
+import os
+import numpy as np
+from fields.standard import read_numeric_blocks
+
+"""
+Bulk readers for the ascii phase volume files, like the step-warp_uem.txt
+files written by diagnostics.phase_volume.dump_phase_volume.  The text is
+parsed in large blocks straight into float64 arrays instead of line by line,
+with the shared parser of fields.standard.read_numeric_blocks.
+"""
+
+dump_fieldnames = ["x","y","z","px","py","pz","vx","vy","vz"]
+phase_fieldnames = ["x","y","z","px","py","pz"]
+
+def is_number(string):
+  """
+  Returns True if the string can be converted to a float.
+  """
+  try:
+    float(string)
+  except ValueError:
+    return False
+  return True
+
+def detect_fieldnames(filepath,header=None,fieldnames=None,delimiter=" "):
+  """
+  Works out the fieldnames of a phase volume file from its first line.
+  Args:
+    filepath: The path to the ascii file.
+    header: True if the first line holds the fieldnames, False if it does
+      not, and None to decide from whether the first line is numeric.
+    fieldnames: The fieldnames to use when there is no header.  If None,
+      they are chosen from the number of columns (9 columns is the dump
+      format and 6 columns is x, y, z, px, py, pz).
+    delimiter: The string separating the columns.
+  Return value:
+    (fieldnames, header): The fieldnames and whether the first line is a header.
+  """
+  with open(filepath,"r") as f:
+    first_line = f.readline()
+  pieces = [p for p in first_line.strip().split(delimiter) if p != '']
+  if header is None:
+    header = len(pieces) > 0 and not is_number(pieces[0])
+  if header:
+    return (pieces, True)
+  if fieldnames is None:
+    return detect_fieldnames_from_column_count(filepath,len(pieces))
+  return (list(fieldnames), False)
+
+def detect_fieldnames_from_column_count(filepath,ncolumns):
+  """
+  Returns (fieldnames, False) for a file without a header with ncolumns
+  columns: 9 columns is the dump format and 6 is x, y, z, px, py, pz.
+  """
+  if ncolumns == len(dump_fieldnames):
+    return (list(dump_fieldnames), False)
+  if ncolumns == len(phase_fieldnames):
+    return (list(phase_fieldnames), False)
+  raise Exception("Cannot infer the fieldnames of " + filepath + " with " +
+                  str(ncolumns) + " columns.")
+
+def read_phase_volume_chunks(filepath,header=None,fieldnames=None,delimiter=" ",
+                             chunk_bytes=2**24):
+  """
+  Generator that reads a phase volume file in blocks of about chunk_bytes
+  and yields each block as a dict of float64 numpy arrays keyed by the
+  fieldnames.  Memory stays bounded by the block size.
+  Args:
+    filepath: The path to the ascii file.
+    header, fieldnames, delimiter: See detect_fieldnames.
+    chunk_bytes: The approximate number of bytes of text parsed at once.
+  Yields:
+    A dict of numpy arrays with one entry per fieldname.
+  """
+  fieldnames, header = detect_fieldnames(filepath,header,fieldnames,delimiter)
+  ncolumns = len(fieldnames)
+  with open(filepath,"r") as f:
+    if header:
+      f.readline()
+    for table in read_numeric_blocks(f,ncolumns,chunk_bytes,filepath,delimiter=delimiter):
+      yield dict([(fieldnames[i],table[:,i].copy()) for i in range(ncolumns)])
+
+def read_phase_volume_npy_chunks(filepath,fieldnames=None,chunk_rows=2**20):
+  """
+  Generator that memory maps an (n,ncolumns) .npy phase volume file, like the
+  step-warp_uem.npy files of dump_phase_volume_binary, and yields blocks of
+  chunk_rows rows as dicts of float64 numpy arrays keyed by the fieldnames.
+  """
+  table = np.load(filepath,mmap_mode="r")
+  if fieldnames is None:
+    fieldnames, header = detect_fieldnames_from_column_count(filepath,table.shape[1])
+  for start in range(0,table.shape[0],chunk_rows):
+    block = np.asarray(table[start:start+chunk_rows],dtype=np.float64)
+    yield dict([(fieldnames[i],block[:,i].copy()) for i in range(len(fieldnames))])
+
+def read_phase_volume_file_chunks(filepath,**kwargs):
+  """
+  Dispatches to read_phase_volume_npy_chunks for .npy files and to
+  read_phase_volume_chunks otherwise.
+  """
+  if os.path.splitext(filepath)[1] == ".npy":
+    npy_kwargs = dict([(k,v) for k, v in kwargs.iteritems() if k in ["fieldnames","chunk_rows"]])
+    return read_phase_volume_npy_chunks(filepath,**npy_kwargs)
+  text_kwargs = dict([(k,v) for k, v in kwargs.iteritems() if k != "chunk_rows"])
+  return read_phase_volume_chunks(filepath,**text_kwargs)
@@ -0,0 +1,128 @@
+import numpy as np
+from scipy import constants
+from coordinates.coordinate_vector import CoordinateException
+from coordinates.kinematics import velocity_from_momentum
+from coordinates.my_covariance_matrix import covariance_order, get_normalized_emittances
+
+"""
+Slice analysis of a phase volume: the particles are binned along z (or t)
+with a single sort, and the per-slice covariance, normalized emittances,
+energy spread and current are computed with segmented reductions
+(np.add.reduceat) instead of rebuilding a phase volume for every slice.
+"""
+
+electron_charge_mass_ratio = constants.physical_constants["electron charge to mass quotient"][0]
+
+slice_table_fields = ["lower_edge", "upper_edge", "center", "count", "charge",
+                      "mean_x", "mean_y", "mean_z", "mean_pz", "mean_E",
+                      "sigma_x", "sigma_y", "sigma_z",
+                      "emittance_nx", "emittance_ny", "emittance_nz",
+                      "sigma_E", "relative_sigma_E", "current"]
+
+def get_slice_edges(values,number_of_slices):
+  """
+  Returns number_of_slices+1 evenly spaced edges covering all of the values.
+  The lowest edge sits just below the minimum because slices exclude their
+  lower edge.
+  """
+  if values.size == 0:
+    raise CoordinateException("The slice edges of an empty phase volume are undefined, pass the edges explicitly.")
+  lower = np.nextafter(values.min(),-np.inf)
+  upper = values.max()
+  return np.linspace(lower,upper,number_of_slices+1)
+
+def calc_slice_covariances(phase_volume,coordinate="z",edges=None,number_of_slices=20):
+  """
+  Bins the particles of the phase volume along the coordinate and returns the
+  covariance matrix of x, y, z, px, py, pz, E in every slice.  Like the
+  CovarianceAccumulator behind the emittance history, the normalization is
+  1/(N-1), so that slice and whole beam emittances can be compared.
+  Args:
+    phase_volume: A Phase6DVolume (or TimedPhase6DVolume).
+    coordinate: The fieldname along which to slice, normally "z" or "t".
+    edges: The sorted slice edges.  Slice i holds the particles with
+      edges[i] < coordinate <= edges[i+1].  If None, number_of_slices
+      even slices spanning the ensemble are used.
+  Return value:
+    (edges, counts, means, covariances): The edges, the number of particles
+      per slice, the (nslices,7) means and the (nslices,7,7) covariances.
+      Slices with no particles have means and covariances of nan, slices
+      with one particle have covariances of nan.
+  """
+  values = np.asarray(phase_volume.getArrayFromFieldname(coordinate))
+  if edges is None:
+    edges = get_slice_edges(values,number_of_slices)
+  edges = np.asarray(edges,dtype=np.float64)
+  order = np.argsort(values,kind="mergesort")
+  boundaries = np.searchsorted(values[order],edges,side="right")
+  order = order[boundaries[0]:boundaries[-1]] #Drop particles outside of the edges.
+  boundaries = boundaries - boundaries[0]
+  counts = np.diff(boundaries)
+  nslices = counts.size
+  filled = counts > 0
+  starts = boundaries[:-1][filled]
+
+  columns = np.vstack([np.asarray(phase_volume.getArrayFromFieldname(o))[order] for o in covariance_order])
+  means = np.full((nslices,len(covariance_order)),np.nan)
+  covariances = np.full((nslices,len(covariance_order),len(covariance_order)),np.nan)
+  if starts.size == 0:
+    return (edges, counts, means, covariances)
+  filled_counts = counts[filled].astype(np.float64)
+  filled_means = np.add.reduceat(columns,starts,axis=1)/filled_counts
+  degrees_of_freedom = np.where(filled_counts > 1,filled_counts - 1,np.nan)
+  columns -= np.repeat(filled_means,counts[filled],axis=1) #Two pass: center within each slice.
+  filled_covariances = np.empty((starts.size,len(covariance_order),len(covariance_order)))
+  for i in range(len(covariance_order)):
+    for j in range(i,len(covariance_order)):
+      filled_covariances[:,i,j] = np.add.reduceat(columns[i]*columns[j],starts)/degrees_of_freedom
+      filled_covariances[:,j,i] = filled_covariances[:,i,j]
+  means[filled] = filled_means.T
+  covariances[filled] = filled_covariances
+  return (edges, counts, means, covariances)
+
+def calc_slice_table(phase_volume,coordinate="z",edges=None,number_of_slices=20,
+                     charge_mass_ratio=electron_charge_mass_ratio):
+  """
+  Returns a numpy record array with one row per slice and the columns in
+  slice_table_fields.  Emittances are normalized rms emittances
+  sqrt(det Cov(q,pq))/(m c) in m rad, sigma_E is the rms energy spread in J,
+  and the current is charge per slice duration (charge*<vz>/dz for z slices).
+  Args:
+    phase_volume, coordinate, edges, number_of_slices: See calc_slice_covariances.
+    charge_mass_ratio: |q/m| used to get each macroparticle's charge from its
+      mass.  Defaults to the electron value.
+  """
+  edges, counts, means, covariances = calc_slice_covariances(phase_volume,coordinate,edges,number_of_slices)
+  index = dict([(name,i) for i, name in enumerate(covariance_order)])
+  mass = np.asarray(phase_volume.getArrayFromFieldname("mass"))
+  particle_mass = mass.mean() if mass.size > 0 else np.nan
+
+  table = np.zeros(counts.size,dtype=[(name,np.float64) for name in slice_table_fields])
+  table["lower_edge"] = edges[:-1]
+  table["upper_edge"] = edges[1:]
+  table["center"] = 0.5*(edges[:-1] + edges[1:])
+  table["count"] = counts
+  table["charge"] = counts*particle_mass*np.abs(charge_mass_ratio)
+  for name in ["x","y","z","pz","E"]:
+    table["mean_"+name] = means[:,index[name]]
+  emittances = get_normalized_emittances(covariances,particle_mass,
+                  dict([(name,[name,"p"+name]) for name in ["x","y","z"]]))
+  for name in ["x","y","z"]:
+    table["sigma_"+name] = np.sqrt(covariances[:,index[name],index[name]])
+    table["emittance_n"+name] = emittances[name]
+  table["sigma_E"] = np.sqrt(covariances[:,index["E"],index["E"]])
+  table["relative_sigma_E"] = table["sigma_E"]/table["mean_E"]
+  width = np.diff(edges)
+  if coordinate in ["t","time"]:
+    table["current"] = table["charge"]/width
+  else:
+    mean_vz = velocity_from_momentum(0.,0.,table["mean_pz"],particle_mass)[2]
+    table["current"] = table["charge"]*np.abs(mean_vz)/width
+  table["current"][counts == 0] = 0.
+  return table
+
+def write_slice_table(table,filepath):
+  """
+  Writes the slice table to an ascii file with a header line of the fieldnames.
+  """
+  np.savetxt(filepath,table.view(np.float64).reshape(table.size,-1),header=" ".join(table.dtype.names),comments="")
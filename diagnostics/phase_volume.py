@@ -1,3 +1,6 @@
+import numpy as np
+from coordinates.kinematics import momentum_from_normalized_momentum
+
 def dump_phase_volume(step,obj,mass):
   """
   Prints out the phase volume of a species to a file named with step.
@@ -14,9 +17,7 @@ def dump_phase_volume(step,obj,mass):
   x = obj.getx()
   y = obj.gety()
   z = obj.getz()
-  px = mass*obj.getux()
-  py = mass*obj.getuy()
-  pz = mass*obj.getuz()
+  px, py, pz = momentum_from_normalized_momentum(obj.getux(),obj.getuy(),obj.getuz(),mass)
   vx = obj.getvx()
   vy = obj.getvy()
   vz = obj.getvz()
@@ -35,4 +36,24 @@ def dump_phase_volume(step,obj,mass):
       output.append(vz[i])
       output = [str(o) for o in output]
       f.write(" ".join(output) + "\n")
-  return 
+  return
+
+def dump_phase_volume_binary(step,obj,mass):
+  """
+  Saves the phase volume of a species as an (n,9) float64 array with the
+  columns x, y, z, px, py, pz, vx, vy, vz (the same as dump_phase_volume)
+  to a numpy file named with step.
+  Args:
+    obj: A container holding the species for which the phase volume will be
+      obtained. 
+    mass: The mass of the macroparticle used to do momentum conversion.
+    step: The iteration after which we are running the dump.  The output file
+      will be named step-warp_uem.npy in the running directory.
+  Return value:
+    None --- but writes to the output file 
+  """
+  px, py, pz = momentum_from_normalized_momentum(obj.getux(),obj.getuy(),obj.getuz(),mass)
+  table = np.column_stack([obj.getx(), obj.gety(), obj.getz(), px, py, pz,
+                           obj.getvx(), obj.getvy(), obj.getvz()])
+  np.save(str(step)+"-warp_uem.npy",table)
+  return
@@ -1,3 +1,4 @@
+import itertools
 import numpy as np
 
 def get_supremum_index(numpy_array,value):
@@ -26,10 +27,91 @@ def get_index_of_point(numpy_array,stepsize):
   Return value:
     numpy_indices: A numpy array with the indices.
   """
-  output = np.around( ( numpy_array-numpy_array.min() )/stepsize ) 
-  return np.array([int(o) for o in output])
+  return np.rint( ( numpy_array-numpy_array.min() )/stepsize ).astype(np.int64)
 
-def r_mesh_to_xy_mesh(r_array,scale=2.0,**kwargs):
+def get_lexsorted_priority(differences):
+  """
+  Returns the axes, fastest varying first, for which points are already
+  in lexicographic order, or None if they are not in any such order.
+  Args:
+    differences: A list of np.diff of the coordinates along each axis.
+  """
+  for priority in itertools.permutations(range(len(differences))):
+    undecided = np.ones(differences[0].size,dtype=bool)
+    in_order = True
+    for k in reversed(priority):
+      if np.any(undecided & (differences[k] < 0)):
+        in_order = False
+        break
+      undecided &= (differences[k] == 0)
+    if in_order:
+      return list(priority)
+  return None
+
+def infer_grid(coordinate_arrays,tolerance=0.01):
+  """
+  Infers the uniform grid on which the points lie from a single lexsort
+  of their coordinates, and returns the Fortran ordered linear index of
+  every point on that grid.  Points already in the order of some axis
+  priority, as written by most field solvers, are not sorted at all.
+  Args:
+    coordinate_arrays: A list of numpy arrays of the coordinates of the
+      points, the fastest varying (Fortran) axis first, e.g. [x, y, z].
+    tolerance: The distance from a grid node, in units of the stepsize,
+      above which a point is reported off grid.
+    Points off the grid, or an axis along which all points share one
+    coordinate, raise an exception.
+  Return value:
+    A dict with the keys
+      minimum, stepsize, number_of_steps: Lists with one entry per axis.
+        The stepsize is the median spacing between neighbours along the
+        axis and number_of_steps is the number of intervals.
+      shape: The tuple of the number of nodes along each axis.
+      indices: The linear Fortran index of every point.
+      missing: The number of grid nodes without a point.
+      duplicates: The number of grid nodes with more than one point.
+  """
+  columns = [np.asarray(c,dtype=np.float64) for c in coordinate_arrays]
+  differences = [np.diff(c) for c in columns]
+  priority = get_lexsorted_priority(differences)
+  if priority is None: #Files are usually written in grid order, so this is rare.
+    priority = range(len(columns))
+    order = np.lexsort(columns) #The last column is the primary key.
+    differences = [np.diff(c[order]) for c in columns]
+  #Neighbours in lexsorted order differ along an axis only where all slower axes agree.
+  slower_constant = np.ones(max(columns[0].size-1,0),dtype=bool)
+  steps = [None]*len(columns)
+  for k in reversed(priority):
+    steps[k] = differences[k][slower_constant & (differences[k] != 0)]
+    slower_constant &= (differences[k] == 0)
+
+  output = {"minimum": [], "stepsize": [], "number_of_steps": []}
+  indices = np.zeros(columns[0].size,dtype=np.int64)
+  stride = 1
+  for k, column in enumerate(columns):
+    minimum = column.min()
+    stepsize = np.median(steps[k]) if steps[k].size > 0 else 0.
+    if not stepsize > 0:
+      raise Exception("The grid is degenerate along axis " + str(k) + 
+                      ": all points have the coordinate " + str(minimum) + ".")
+    axis_indices = np.rint((column - minimum)/stepsize).astype(np.int64)
+    if np.any(np.abs(column - minimum - axis_indices*stepsize) > tolerance*stepsize):
+      raise Exception("The points are not on a uniform grid along axis " + str(k) + 
+                      " with stepsize " + str(stepsize) + ".")
+    number_of_steps = int(axis_indices.max())
+    output["minimum"].append(minimum)
+    output["stepsize"].append(stepsize)
+    output["number_of_steps"].append(number_of_steps)
+    indices += stride*axis_indices
+    stride *= number_of_steps+1
+  output["shape"] = tuple([n+1 for n in output["number_of_steps"]])
+  output["indices"] = indices
+  counts = np.bincount(indices,minlength=stride)
+  output["missing"] = int(np.sum(counts == 0))
+  output["duplicates"] = int(np.sum(counts > 1))
+  return output
+
+def r_mesh_to_xy_mesh(r_array,scale=2.0,quadrant=False,**kwargs):
   """
   Returns a square mesh describing the circle represented by  r_array (assuming
   invariance by rotation) using the stepsize for x,y of dr/scale.
@@ -37,6 +119,8 @@ def r_mesh_to_xy_mesh(r_array,scale=2.0,**kwargs):
     r_array: A numpy array.
     scale: The amount by which we will divide the stepsize in r to get the
       stepsizes for x and y.
+    quadrant: If True, only the x >= 0, y >= 0 quadrant of the square is
+      meshed, starting at x = y = 0.
   Return value:
     Two numpy arrays, x and y, and their stepsizes, dx and dy.
   """
@@ -47,91 +131,74 @@ def r_mesh_to_xy_mesh(r_array,scale=2.0,**kwargs):
   
   #Derive important stats for x and y.
   dx = dr/scale
-  xmin = -rmax
   nmax = np.ceil(rmax/dx) #Box has x = rmax.
-  n = int(2*nmax)+1
+  if quadrant:
+    xmin = 0
+    n = int(nmax)+1
+  else:
+    xmin = -rmax
+    n = int(2*nmax)+1
   
-  #Create and fill the x y arrays
-  x = np.zeros(n**2)
-  y = np.zeros(n**2)
-  for i in range(n):
-    val = xmin + i*dx
-    xslice = range(i,n**2,n) #Every nth element starting with the ith element.
-    yslice = slice(i*n,(i+1)*n) #The ith block of n consequetive elements.
-    x[xslice] = val
-    y[yslice] = val
+  #Create the x y arrays: x cycles fastest, y is constant over blocks of n.
+  values = xmin + np.arange(n)*dx
+  x = np.tile(values,n)
+  y = np.repeat(values,n)
   return (x, y, dx, dx, n-1, n-1)
 
+def get_linear_interpolation_weights(r_array, r_xy):
+  """
+  Returns the lower indices and the weights to linearly interpolate
+  values given at the sorted r_array points onto r_xy.  Points below
+  the first or above the last r are linearly extrapolated from the
+  first or last interval.
+  Args:
+    r_array: A sorted numpy array of at least 2 radial values.
+    r_xy: A numpy array of the radii to interpolate to.
+  Return value:
+    (lower_index, upper_weight): The value at r_xy is
+      f[lower_index]*(1-upper_weight) + f[lower_index+1]*upper_weight.
+  """
+  lower_index = np.searchsorted(r_array,r_xy,side="right") - 1
+  np.clip(lower_index,0,r_array.size-2,out=lower_index)
+  r_lower = r_array[lower_index]
+  upper_weight = (r_xy - r_lower)/(r_array[lower_index+1] - r_lower)
+  return (lower_index, upper_weight)
+
 def linear_field_projection_from_r_to_xy(r_array, fr, fz, x_array, y_array):
   """
   Uses a linear interpolation on x y points that fall within
   rmin to rmax and a linear extrapolation on the points that
-  fall outside of this interval.
+  fall outside of this interval.  The radius of every x y point and
+  the interpolation weights are computed once and applied to all
+  planes of the field at the same time.
   Args:
-    r_array: A numpy array of radial values.
+    r_array: A sorted numpy array of radial values.
     fr: A numpy array of the tangent field in the r direction at 
-      at each r point in the r numpy array.
+      at each r point in the r numpy array.  It may also be of shape
+      (nplanes, r_array.size) to project several z planes at once.
     fz: A numpy array of the tangent field in the z direction at 
-      at each r point in the r numpy array.
+      at each r point in the r numpy array, shaped like fr.
     x_array: The x points onto which we plan on projecting.
     y_array: The y points onto which we plan on projection.
   Return value:
     fx_out: A numpy array of the tangent field in the x direction at 
-      at each x outer_product y point.
+      at each x outer_product y point (shape (nplanes, x_array.size)
+      for 2D fr).
     fy_out: A numpy array of the tangent field in the y direction at 
       at each x outer_product y point.
     fz_out: A numpy array of the tangent field in the z direction at 
       at each x outer_product y point.
   """
-  #Extract r stats to be used.
-  rmin = 0
-  rmax = r_array.max()
-  dr = np.average( np.diff( np.unique(r_array) ) )
+  r_xy = np.sqrt( x_array**2 + y_array**2 )
+  lower_index, upper_weight = get_linear_interpolation_weights(r_array, r_xy)
+  on_axis = (r_xy == 0)
+  #cos and sin of the azimuth; on axis both components take fr[0].
+  cos_phi = np.where(on_axis, 1., x_array/np.where(on_axis, 1., r_xy))
+  sin_phi = np.where(on_axis, 1., y_array/np.where(on_axis, 1., r_xy))
 
-  #Initialize and fill tangent field elements.
-  fx_out = np.zeros(x_array.size)
-  fy_out = np.zeros(x_array.size)
-  fz_out = np.zeros(x_array.size)
-  for i in range(x_array.size):
-    x = x_array[i]
-    y = y_array[i]
-    r_xy = np.sqrt( x**2 + y**2 )
-    if r_xy == 0:
-      fx_out[i] = fr[0]
-      fy_out[i] = fr[0]
-      fz_out[i] = fz[0]
-      continue
-    elif r_xy == rmin: #Just the first element
-      fr_to_use = fr[0]
-      fz_to_use = fz[0]
-    elif r_xy == rmax: #Just the last element
-      fr_to_use = fr[-1]
-      fz_to_use = fz[-1]
-    elif r_xy < rmin: #extrapolation from the first element.
-      fr_slope = (fr[1]-fr[0])/dr
-      dfr = fr_slope * (rmin-r_xy)
-      fz_slope = (fz[1]-fz[0])/dr
-      dfz = fz_slope * (rmin-r_xy)
-      fr_to_use = (fr[0]-dfr)
-      fz_to_use = (fz[0]-dfz)
-    elif r_xy > rmax: #extrapolation from the last element.
-      fr_slope = (fr[-1]-fr[-2])/dr
-      dfr = fr_slope * (r_xy-rmax)
-      fz_slope = (fz[-1]-fz[-2])/dr
-      dfz = fz_slope * (r_xy-rmax)
-      fr_to_use = (fr[-1]+dfr)
-      fz_to_use = (fz[-1]+dfz)
-    else:
-      supremum_index = get_supremum_index(r_array,r_xy)
-      r_lower = r_array[supremum_index]
-      r_upper = r_array[supremum_index+1]
-      fr_lower = fr[supremum_index]
-      fr_upper = fr[supremum_index+1]
-      fz_lower = fz[supremum_index]
-      fz_upper = fz[supremum_index+1]
-      fr_to_use = fr_lower*(r_xy-r_lower)/dr + fr_upper*(r_upper-r_xy)/dr #Linear interpolation
-      fz_to_use = fz_lower*(r_xy-r_lower)/dr + fz_upper*(r_upper-r_xy)/dr #Linear interpolation
-    fx_out[i] = fr_to_use*x/r_xy
-    fy_out[i] = fr_to_use*y/r_xy
-    fz_out[i] = fz_to_use
-  return (fx_out, fy_out, fz_out)
+  #take keeps the planes in C order, where fancy indexing would not.
+  fr_out = np.take(fr,lower_index,axis=-1)*(1-upper_weight) + np.take(fr,lower_index+1,axis=-1)*upper_weight
+  fz_out = np.take(fz,lower_index,axis=-1)*(1-upper_weight) + np.take(fz,lower_index+1,axis=-1)*upper_weight
+  fr_out[...,on_axis] = fr[...,:1]
+  fz_out[...,on_axis] = fz[...,:1]
+  return (fr_out*cos_phi, fr_out*sin_phi, fz_out)
@@ -1,31 +1,63 @@
 import csv
 from warp import *
-from fields.standard import count_lines, convert_list_of_dicts_to_dict_of_numpy_arrays
+from fields.standard import count_lines, read_numeric_columns
 
-def read_dat_file_as_numpy_arrays(dat_file):
+length_fieldnames = ["x","y","z","r"] #Stored in mm by Poisson.
+
+def read_dat_file_as_numpy_arrays(dat_file,chunk_bytes=2**24):
   """
-  Wraps the read_dat_file function so that the "data"
-  output field is now a dictionary of numpy arrays instead of 
-  a list of dicts.
+  Reads a dat field file (as given to me by Chung-Yu Ruan)
+  straight into numpy arrays.  The body is parsed in blocks
+  into one preallocated array, so the peak memory is about that
+  of the returned arrays.  All fieldnames will be in lower case only
+  and x, y, z and r are converted from mm to m.
   Args:
     dat_file: File with the .dat extension taken from the output
       of Poisson (I think)
+    chunk_bytes: The approximate number of bytes of text parsed at once.
   Return value:
     output: Dictionary with the keys
       fieldnames: The keys of the dictionary in the order they
         appear in the file.
       data: A dictionary of numpy arrays keyed by the fieldnames.
   """
-  output = read_dat_file(dat_file)
-  output["data"] = convert_list_of_dicts_to_dict_of_numpy_arrays(output["data"])
+  output = {}
+  max_rows = count_lines(dat_file) - 6
+  with open(dat_file,"r") as f:
+    output["fieldnames"] = read_dat_header(f,dat_file)
+    table = read_numeric_columns(f,len(output["fieldnames"]),max(max_rows,0),chunk_bytes,dat_file)
+  output["data"] = {}
+  for i, fieldname in enumerate(output["fieldnames"]):
+    if fieldname in length_fieldnames:
+      table[i] /= 1000 #Fix units
+    output["data"][fieldname] = table[i]
   return output
 
+def read_dat_header(f,dat_file):
+  """
+  Reads the 6 header lines of an open dat file, leaving f at the
+  first data line.
+  Return value:
+    The lower case fieldnames from the fifth line.
+  """
+  for i in range(4): #Skip first 4 lines
+    line = f.readline()
+  #Get fieldnames (keys from header)
+  fieldnames = f.readline().strip().lower().split()
+  #Skip next line and check to make sure it has correct format.
+  line = f.readline().strip()
+  if not line.startswith("==="):
+    raise Exception("Check format of " + dat_file + "." +
+      "It appears as if the sixth line is not \"===...\".")
+  return fieldnames
+
 def read_dat_file(dat_file):
   """
   Reads a dat field file (as given to me by Chung-Yu Ruan)
   returning an object with elements data.  The
   data will be returned a list of dicts with the header
   fieldnames as keys.  All fieldnames will be in lower case only.
+  Prefer read_dat_file_as_numpy_arrays for large files.
   Args:
     dat_file: File with the .dat extension taken from the output
       of Poisson (I think)
@@ -36,29 +68,9 @@ def read_dat_file(dat_file):
       data: A table (rows of dicts) keyed by whatever is in
         the header.
   """
-  output = {}
-  with open(dat_file,"r") as f:
-    for i in range(4): #Skip first 4 lines
-      line = f.readline()
-    #Get fieldnames (keys from header)
-    output["fieldnames"] = f.readline().strip().lower().split()
-    #Skip next line and check to make sure it has correct format.
-    line = f.readline().strip()
-    if not line.startswith("==="):
-      raise Exception("Check format of " + dat_file + "." +
-        "It appears as if the sixth line is not \"===...\".")
-    #Load data as floats.
-    table = []
-    for line in f:
-      line = line.strip()
-      pieces = line.split()
-      pieces = [float(p) for p in pieces]
-      row = dict(zip(output["fieldnames"],pieces))
-      for fieldname in output["fieldnames"]:
-        if fieldname in ["x","y","z","r"]:
-          row[fieldname] = row[fieldname]/1000 #Fix units
-      table.append(row)
-    output["data"] = table
+  output = read_dat_file_as_numpy_arrays(dat_file)
+  columns = [output["data"][fieldname] for fieldname in output["fieldnames"]]
+  output["data"] = [dict(zip(output["fieldnames"],row)) for row in zip(*columns)]
   return output
    
     
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from ConfigParser import RawConfigParser
+from fields.field_preprocessor import FieldPreProcessor
+
+"""
+A local cache of preprocessed field maps keyed by the content of the raw
+field file and the preprocessing options, so sweep jobs that use the same
+raw maps preprocess them once.  Each entry is a directory holding the .cfg
+and the .npy components written by FieldPreProcessor.archive.  The cache is
+bounded in bytes and the least recently used entries are evicted first.
+The location and size can be set with the WARP_UEM_FIELD_CACHE and
+WARP_UEM_FIELD_CACHE_BYTES environment variables.
+"""
+
+default_cache_directory = os.environ.get("WARP_UEM_FIELD_CACHE",
+                            os.path.join(os.path.expanduser("~"),".cache","warp_uem","fields"))
+default_max_bytes = int(os.environ.get("WARP_UEM_FIELD_CACHE_BYTES",16*2**30))
+#Bump when the preprocessed output changes so that old entries are not reused.
+cache_format_version = 1
+#Options that change the preprocessed arrays.  Others, like number_of_workers, do not.
+keyed_options = ["formattype", "quadrant", "native_rz"]
+
+def get_file_digest(filepath,block_bytes=2**20):
+  """
+  Returns the sha1 hex digest of the contents of the file.
+  """
+  digest = hashlib.sha1()
+  with open(filepath,"rb") as f:
+    while True:
+      block = f.read(block_bytes)
+      if block == "":
+        break
+      digest.update(block)
+  return digest.hexdigest()
+
+def get_cache_key(filepath,**options):
+  """
+  Returns the key of the preprocessed field of the raw field file.
+  Args:
+    filepath: The path to the raw field file.
+    options: The FieldPreProcessor keyword arguments.  Only those in
+      keyed_options are part of the key.
+  Return value:
+    A hex digest of the file contents, the keyed options and the
+    cache format version.
+  """
+  digest = hashlib.sha1(get_file_digest(filepath))
+  digest.update(str(cache_format_version))
+  for option in keyed_options:
+    digest.update("|" + option + "=" + repr(options.get(option)))
+  return digest.hexdigest()
+
+def get_directory_bytes(directory):
+  """
+  Returns the summed size of the files in the directory.
+  """
+  return sum([os.path.getsize(os.path.join(directory,f)) for f in os.listdir(directory)])
+
+class FieldCache(object):
+  """
+  A directory of preprocessed field maps keyed by get_cache_key.
+  """
+
+  config_filename = "field.cfg"
+
+  def __init__(self,directory=None,max_bytes=None):
+    """
+    Args:
+      directory: The cache directory.  Default is default_cache_directory.
+      max_bytes: The size above which least recently used entries are
+        evicted.  Default is default_max_bytes.
+    """
+    if directory is None:
+      directory = default_cache_directory
+    if max_bytes is None:
+      max_bytes = default_max_bytes
+    self.directory = directory
+    self.max_bytes = max_bytes
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError: #Made by another process in the meantime.
+        pass
+
+  def getEntryDirectory(self,key):
+    """
+    Returns the directory of the entry of the key.
+    """
+    return os.path.join(self.directory,key)
+
+  def getConfigFilepath(self,filepath,**options):
+    """
+    Returns the path to the .cfg of the preprocessed raw field file,
+    preprocessing it and adding it to the cache on a miss.
+    Args:
+      filepath: The path to the raw field file.
+      options: Keyword arguments for FieldPreProcessor such as formattype,
+        quadrant, native_rz and number_of_workers.
+    Return value:
+      The path to the config file to give to the FieldLoader.
+    """
+    key = get_cache_key(filepath,**options)
+    entry_directory = self.getEntryDirectory(key)
+    if not os.path.isdir(entry_directory):
+      self.addEntry(key,filepath,**options)
+    os.utime(entry_directory,None) #Mark as most recently used.
+    self.evict(keep=key)
+    return os.path.join(entry_directory,self.config_filename)
+
+  def addEntry(self,key,filepath,**options):
+    """
+    Preprocesses the raw field file into a scratch directory inside the
+    cache and renames it to the entry directory, so concurrent jobs never
+    see a partial entry.  The field paths in the .cfg are made relative
+    to the entry directory.
+    """
+    scratch_directory = tempfile.mkdtemp(prefix=".building_",dir=self.directory)
+    try:
+      front = os.path.join(scratch_directory,os.path.splitext(self.config_filename)[0])
+      field_preprocessor = FieldPreProcessor(filepath,**options)
+      field_preprocessor.archive(front,config_file_front=front,binary=True)
+      config = RawConfigParser()
+      config.read(front + ".cfg")
+      for section in config.sections():
+        for option in config.options(section):
+          if option.endswith("_npy_field"):
+            config.set(section,option,os.path.basename(config.get(section,option)))
+      with open(front + ".cfg","w") as f:
+        config.write(f)
+      try:
+        os.rename(scratch_directory,self.getEntryDirectory(key))
+      except OSError: #Another process added the same entry first.
+        pass
+    finally:
+      if os.path.isdir(scratch_directory):
+        shutil.rmtree(scratch_directory)
+
+  def getEntries(self):
+    """
+    Returns a list of (last use time, bytes, key) of the complete entries.
+    """
+    entries = []
+    for key in os.listdir(self.directory):
+      entry_directory = self.getEntryDirectory(key)
+      if key.startswith(".") or not os.path.isdir(entry_directory):
+        continue
+      try:
+        entries.append((os.path.getmtime(entry_directory),get_directory_bytes(entry_directory),key))
+      except OSError: #Evicted by another process.
+        continue
+    return entries
+
+  def evict(self,keep=None):
+    """
+    Removes the least recently used entries until the cache holds at
+    most max_bytes.  The entry of the key keep is never removed.
+    Return value:
+      The list of removed keys.
+    """
+    entries = sorted(self.getEntries())
+    total_bytes = sum([size for used, size, key in entries])
+    removed = []
+    for used, size, key in entries:
+      if total_bytes <= self.max_bytes:
+        break
+      if key == keep:
+        continue
+      shutil.rmtree(self.getEntryDirectory(key),ignore_errors=True)
+      total_bytes -= size
+      removed.append(key)
+    return removed
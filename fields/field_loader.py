@@ -4,10 +4,13 @@ try:
 except ImportError:
   import pickle
 import numpy as np
+from ConfigParser import RawConfigParser
 from config.my_config import MyConfigParser as ConfigParser
 from Forthon import fzeros
-from discrete_fourspace.mesh import get_index_of_point
+from discrete_fourspace.mesh import get_index_of_point, r_mesh_to_xy_mesh
+from discrete_fourspace.mesh import linear_field_projection_from_r_to_xy
 from fields.dat import read_dat_file_as_numpy_arrays
+from fields.field_cache import FieldCache
 from fields.time_dependent_functions import sine_at_com_distance
 from warp import *
 
@@ -24,7 +27,10 @@ class FieldLoader(object):
     Also loads and saves the fields. 
     Args:
       config_filepath: filepath to the config file for the field.  Either this or the
-        config object needs to be present.
+        config object needs to be present.  If this is a raw field file (not .cfg),
+        it is preprocessed through the FieldCache, or taken from it, with the
+        keyword arguments formattype, quadrant, native_rz (default True) and
+        number_of_workers, and field_cache_directory picks the cache.
       config: A config parser object.  Allows the reading of this data from an existent
         config parser object.
       section: The name of the section in the filepath with the field info.  Default
@@ -41,15 +47,25 @@ class FieldLoader(object):
       zlen: The length over which the field is applied.
       current_position: The position of the center of mass of the pulse
         to be used if a distance needs to be calculated.
+      l4symtry: True if the field file only holds the x >= 0, y >= 0 quadrant.
+      rmin: The minimum r of a field stored on its RZ grid.
       time_dependent_function: An option function callback (function is a function of top.time)
         that can add time dependence to the field.  Default is no such function.
     """
     if config_filepath is None and config is None:
       raise Exception("Either the config_filepath needs to be specified or a config parser object " + 
                       "needs to be passed to the init function.")
+    self.config_directory = None
     if config is None:
+      if os.path.splitext(config_filepath)[1] != ".cfg":
+        preprocess_options = dict([(k, v) for k, v in kwargs.iteritems()
+                                   if k in ["formattype","quadrant","native_rz","number_of_workers"]])
+        preprocess_options.setdefault("native_rz",True)
+        field_cache = FieldCache(kwargs.get("field_cache_directory"))
+        config_filepath = field_cache.getConfigFilepath(config_filepath,**preprocess_options)
       config = ConfigParser()
       config.read(config_filepath)
+      self.config_directory = os.path.dirname(os.path.abspath(config_filepath))
     self.config = config
     self.section = section
     
@@ -58,6 +74,12 @@ class FieldLoader(object):
     self.zmin = config.get(section,"zmin")
     self.zmax = config.get(section,"zmax")
     self.zlen = config.get(section,"zlen")
+    self.l4symtry = False
+    if config.has_option(section,"l4symtry"):
+      self.l4symtry = config.get(section,"l4symtry") is True
+    self.rmin = 0.
+    if config.has_option(section,"rmin"):
+      self.rmin = config.get(section,"rmin")
 
     self.stepsize = {}
     self.number_of_steps = {}
@@ -69,11 +91,39 @@ class FieldLoader(object):
         self.number_of_steps[option.replace("n","")] = config.get(section,option)
       if option.endswith("_pickled_field"):
         field_type = option.replace("_pickled_field","")
-        self.fields[field_type] = pickle.load( open(config.get(section,option), "rb") )
+        self.fields[field_type] = pickle.load( open(self.getFilepath(option), "rb") )
         for component in self.fields[field_type]:
-          self.fields[field_type][component] = np.array(self.fields[field_type][component],order="FORTRAN")
+          self.fields[field_type][component] = np.asfortranarray(self.fields[field_type][component])
+      if option.endswith("_npy_field"):
+        field_type, component = option.replace("_npy_field","").rsplit("_",1)
+        if field_type not in self.fields:
+          self.fields[field_type] = {}
+        #Memory mapped, so nothing is read until warp copies the grid.
+        self.fields[field_type][component] = np.load(self.getFilepath(option), mmap_mode="r")
     self.time_dependent_function = time_dependent_function
 
+  def getFilepath(self,option):
+    """
+    Returns the untranslated value of a filepath option, since
+    MyConfigParser.get reads paths starting with t or f as booleans.
+    Relative paths are taken relative to the config file, as in the
+    FieldCache entries, so that a file of the same name in the working
+    directory is never picked up instead.  Only if there is no such file
+    is the path used as given, for archives written with paths relative
+    to the directory they were made in.
+    Args:
+      self: Standard python object oriented notation. 
+      option: The option in the field section.
+    Return value:
+      The filepath string.
+    """
+    filepath = RawConfigParser.get(self.config,self.section,option)
+    if not os.path.isabs(filepath) and self.config_directory is not None:
+      config_relative_filepath = os.path.join(self.config_directory,filepath)
+      if os.path.exists(config_relative_filepath) or not os.path.exists(filepath):
+        return config_relative_filepath
+    return filepath
+
   def isRZ(self):
     """
     Returns true or false depending if the coordinates are RZ or XYZ.
@@ -103,13 +153,18 @@ class FieldLoader(object):
       args_out = [self.zmin, self.zmax]
       kwargs_out = { }
       if self.isRZ():
+        #Warp takes rz grids as (nr+1, 1, nz+1) with x as r and no y.
+        grid_shape = (int(self.number_of_steps["r"])+1, 1, int(self.number_of_steps["z"])+1)
         kwargs_out["rz"] = True
+        kwargs_out["xs"] = self.rmin
         kwargs_out["dx"] = self.stepsize["r"]
-        kwargs_out["dy"] = self.stepsize["z"]
+        kwargs_out["dy"] = self.stepsize["r"]
         kwargs_out["nx"] = self.number_of_steps["r"]
-        kwargs_out["ny"] = self.number_of_steps["z"]
-        kwargs_out[field_abrv+"x"] = field["r"]
-        kwargs_out[field_abrv+"y"] = field["z"]
+        kwargs_out["ny"] = 0
+        kwargs_out["nz"] = self.number_of_steps["z"]
+        kwargs_out[field_abrv+"x"] = np.reshape(field["r"],grid_shape,order="F")
+        kwargs_out[field_abrv+"y"] = np.zeros(grid_shape,order="F")
+        kwargs_out[field_abrv+"z"] = np.reshape(field["z"],grid_shape,order="F")
       else:
         kwargs_out["xs"] = self.xmin
         kwargs_out["ys"] = self.ymin
@@ -121,21 +176,56 @@ class FieldLoader(object):
         kwargs_out[field_abrv+"x"] = field["x"]
         kwargs_out[field_abrv+"y"] = field["y"]
         kwargs_out[field_abrv+"z"] = field["z"]
+        if self.l4symtry:
+          kwargs_out["sy"] = 1 #Quadrupole-like symmetry: reflect the stored quadrant.
       kwargs_out["func"] = self.time_dependent_function
       output[field_type] = {}
       output[field_type]["args"] = args_out
       output[field_type]["kwargs"] = kwargs_out
     return output
 
+  def expandRZToXYZ(self):
+    """
+    Projects a field stored on its RZ grid onto the XYZ grid that
+    FieldPreProcessor.interpolateRToXY would have produced, for use
+    with a 3D solver.
+    Args:
+      self: Standard python object oriented notation. 
+    Return value:
+      None --- but replaces the r and z components by x, y, and z
+        Fortran ordered grids and updates the stepsizes and steps.
+    """
+    nr = int(self.number_of_steps["r"])
+    nz = int(self.number_of_steps["z"])
+    r_array = self.rmin + self.stepsize["r"]*np.arange(nr+1)
+    x_array, y_array, dx, dy, nx, ny = r_mesh_to_xy_mesh(r_array)
+    grid_shape = (nz+1, int(ny)+1, int(nx)+1)
+    for field_type, field in self.fields.iteritems():
+      #Rows of the transposed (nr+1, nz+1) grids are z planes.
+      fx, fy, fz = linear_field_projection_from_r_to_xy(r_array, np.asarray(field["r"]).T,
+                                                        np.asarray(field["z"]).T, x_array, y_array)
+      #(nz, ny, nx) in C order is the (nx, ny, nz) Fortran grid.
+      self.fields[field_type] = {"x": fx.reshape(grid_shape).T,
+                                 "y": fy.reshape(grid_shape).T,
+                                 "z": fz.reshape(grid_shape).T}
+    self.xmin = x_array.min()
+    self.ymin = y_array.min()
+    self.stepsize = {"x": dx, "y": dy, "z": self.stepsize["z"]}
+    self.number_of_steps = {"x": nx, "y": ny, "z": self.number_of_steps["z"]}
+
   def installFields(self,top):
     """
-    Installs the fields within the top object.
+    Installs the fields within the top object.  A field stored on its
+    RZ grid is installed as is for an RZ solver and is projected onto
+    an XYZ grid first for a 3D solver.
     Args:
       self: Standard python object oriented notation. 
       top: The forthon top object generally loaded in warp applications.
     Return value:
       None --- although field id is written.
     """
+    if self.isRZ() and w3d.solvergeom != w3d.RZgeom:
+      self.expandRZToXYZ()
     args_dict = self.getArgs()
     for field_type in args_dict:
       if "id" in self.fields[field_type].keys():
@@ -154,6 +244,15 @@ class FieldLoader(object):
     Return value:
       None
     """
+    if self.isRZ(): #Installed as rz: x is r and there is no y.
+      steps_dict = {"x": self.number_of_steps["r"], "y": 0, "z": self.number_of_steps["z"]}
+      for field_type in self.fields.keys():
+        if "id" in self.fields[field_type]:
+          plot_field_diagnostics(top, field_type, self.fields[field_type]["id"], steps_dict, "x", "x",**kwargs)
+          plot_field_diagnostics(top, field_type, self.fields[field_type]["id"], steps_dict, "x", "z",**kwargs)
+          plot_field_diagnostics(top, field_type, self.fields[field_type]["id"], steps_dict, "z", "x",**kwargs)
+          plot_field_diagnostics(top, field_type, self.fields[field_type]["id"], steps_dict, "z", "z",**kwargs)
+      return
     for field_type in self.fields.keys():
       if "id" in self.fields[field_type]: #Field has been installed.
         plot_field_diagnostics(top, field_type, self.fields[field_type]["id"], self.number_of_steps, "x", "x",**kwargs)
@@ -1,4 +1,7 @@
+import multiprocessing
 import os
+import shutil
+import tempfile
 try:
   import cPickle as pickle
 except ImportError:
@@ -6,7 +9,7 @@ except ImportError:
 import numpy as np
 from ConfigParser import SafeConfigParser as ConfigParser
 from Forthon import fzeros
-from discrete_fourspace.mesh import get_index_of_point, r_mesh_to_xy_mesh
+from discrete_fourspace.mesh import infer_grid, r_mesh_to_xy_mesh
 from discrete_fourspace.mesh import linear_field_projection_from_r_to_xy
 from fields.dat import read_dat_file_as_numpy_arrays
 from fields.rf_asci import read_rf_ascii_file_as_numpy_arrays
@@ -19,7 +22,12 @@ class FieldPreProcessor(object):
 
   def __init__(self,filepath,**kwargs):
     """
-    Reads the filepath into the objects attributes. 
+    Reads the filepath into the objects attributes.  The keyword
+    arguments formattype and number_of_workers are passed on to the
+    file reader and to interpolateRToXY.  With quadrant=True only the
+    x >= 0, y >= 0 quadrant of the grid is kept (see keepQuadrant).
+    With native_rz=True RZ fields are kept as 2D (nr+1, nz+1) grids
+    instead of being projected onto an XYZ grid.
     Attributes:
       input_order: The fieldnames from the imported file header in the
         order they appear in the file.
@@ -35,9 +43,17 @@ class FieldPreProcessor(object):
       zmin: The minimum value of the z coordinate in the filepath.
       zmax: The max z in the field.
       zlen: The length over which the field is applied.
+      quadrant: True if only the first quadrant of the grid is stored.
+      native_rz: True if RZ fields are stored on their RZ grid.
+      fortran_block: True once the field components are views of a
+        Fortran ordered block in the order of the coordinates, as
+        interpolateRToXY leaves them, so no scatter is needed.
     """
     self.filepath = filepath
-    file_content = read_file_as_dict_of_numpy_arrays(filepath,**kwargs)
+    self.fortran_block = False
+    self.quadrant = kwargs.get("quadrant",False)
+    self.native_rz = kwargs.get("native_rz",False)
+    file_content = read_file_as_dict_of_numpy_arrays(filepath,kwargs.get("formattype",""))
     self.input_order = file_content["fieldnames"]
 
     self.parseData(file_content["data"])
@@ -94,6 +110,7 @@ class FieldPreProcessor(object):
       self.number_of_steps = {}
 
     if self.isRZ():
+      self.rmin = self.coordinates["r"].min()
       self.xmin = -1.*self.coordinates["r"].max()
       self.ymin = -1.*self.coordinates["r"].max()
     else:
@@ -102,9 +119,11 @@ class FieldPreProcessor(object):
     self.zmin = self.coordinates["z"].min()
     self.zmax = self.coordinates["z"].max()
     self.zlen = self.zmax - self.zmin
-    for key, np_array in self.coordinates.iteritems():
-      self.stepsize[key] = np.average(np.diff(np.unique(np_array)))
-      self.number_of_steps[key] = np.around( ( np_array.max()-np_array.min() )/self.stepsize[key] )
+    self.grid = None
+    grid = self.getGrid()
+    for i, key in enumerate(self.getGridOrder()):
+      self.stepsize[key] = grid["stepsize"][i]
+      self.number_of_steps[key] = grid["number_of_steps"][i]
     return
     
   def correctZCoordinate(self):
@@ -128,80 +147,130 @@ class FieldPreProcessor(object):
     Return value:
       None --- but rewrites the field numpy arrays.
     """
+    if self.isRZ() and self.native_rz and not self.quadrant:
+      self.ravelRZForFortran()
+      return
     if self.isRZ():
       self.interpolateRToXY(**kwargs)
+    if self.quadrant:
+      self.keepQuadrant()
     self.ravelXYZForFortran()
     return
 
+  def keepQuadrant(self):
+    """
+    Drops the points with x < 0 or y < 0 for storage with 4 fold symmetry.
+    The field must have the parity of a cylindrically symmetric
+    electric field (Ex odd in x, Ey odd in y, Ez even), which warp's
+    quadrupole-like egrd symmetry reflects into the other quadrants.
+    Args:
+      self: Standard python object oriented notation. 
+    Return value:
+      None --- but shrinks the coordinates and fields and sets xmin
+        and ymin to 0.
+    """
+    if "magnetic" in self.fields:
+      raise Exception("Quadrant storage is only supported for electric fields.")
+    keep = (self.coordinates["x"] >= -0.5*self.stepsize["x"]) & \
+           (self.coordinates["y"] >= -0.5*self.stepsize["y"])
+    if not np.all(keep): #A quadrant projection already holds only the quadrant.
+      self.grid = None #The points change.
+      self.fortran_block = False
+      for key in self.coordinates.keys():
+        self.coordinates[key] = self.coordinates[key][keep]
+      for field_type, field in self.fields.iteritems():
+        for component in field.keys():
+          field[component] = field[component].ravel(order="F")[keep]
+    for key in ["x","y"]:
+      if abs(self.coordinates[key].min()) > 0.5*self.stepsize[key]:
+        raise Exception("The " + key + " grid of " + self.filepath + " does not include " + key + " = 0, " +
+                        "so it cannot be stored as a quadrant.")
+      self.number_of_steps[key] = np.around( self.coordinates[key].max()/self.stepsize[key] )
+    self.xmin = 0.
+    self.ymin = 0.
+
   def ravelXYZForFortran(self):
     """
     Ravels the XYZ fields into a convenient format for working
-    with fortran.
+    with fortran.  Fields already in a Fortran block (see
+    interpolateRToXY) are left as they are.
     Args:
       self: Standard python object oriented notation. 
     Return value:
       None --- but rewrites the field numpy arrays.
     """
-    for field_type, field in self.fields.iteritems():
-      fx = fzeros((self.number_of_steps["x"]+1,
-                   self.number_of_steps["y"]+1,
-                   self.number_of_steps["z"]+1) ) 
-      fy = fzeros((self.number_of_steps["x"]+1,
-                   self.number_of_steps["y"]+1,
-                   self.number_of_steps["z"]+1) ) 
-      fz = fzeros((self.number_of_steps["x"]+1,
-                   self.number_of_steps["y"]+1,
-                   self.number_of_steps["z"]+1) ) 
-
-      ix = get_index_of_point(self.coordinates["x"],self.stepsize["x"])
-      iy = get_index_of_point(self.coordinates["y"],self.stepsize["y"])
-      iz = get_index_of_point(self.coordinates["z"],self.stepsize["z"])
-
-      ii = ix + int(self.number_of_steps["x"]+1)*iy + \
-           int(self.number_of_steps["x"]+1)*int(self.number_of_steps["y"]+1)*iz 
-
-      fx.ravel(order='F').put(ii,field["x"]) 
-      fy.ravel(order='F').put(ii,field["y"]) 
-      fz.ravel(order='F').put(ii,field["z"]) 
-      
-      self.fields[field_type]["x"] = fx
-      self.fields[field_type]["y"] = fy
-      self.fields[field_type]["z"] = fz
+    if self.fortran_block:
+      return
+    self.scatterToFortranBlock(["x","y","z"])
 
   def ravelRZForFortran(self):
     """
-    This function is no longer in use
-    Ravels the RZ fields into a convenient format for working
-    with fortran.
+    Ravels the RZ fields into (nr+1, nz+1) Fortran ordered
+    arrays for native RZ storage (see native_rz).
     Args:
       self: Standard python object oriented notation. 
     Return value:
       None --- but rewrites the field numpy arrays.
     """
-    for field_type, field in self.fields.iteritems():
-      fr = fzeros((self.number_of_steps["r"]+1,
-                   self.number_of_steps["z"]+1) ) 
-      fz = fzeros((self.number_of_steps["r"]+1,
-                   self.number_of_steps["z"]+1) ) 
+    self.scatterToFortranBlock(["r","z"])
 
-      ir = get_index_of_point(self.coordinates["r"],self.stepsize["r"])
-      iz = get_index_of_point(self.coordinates["z"],self.stepsize["z"])
+  def scatterToFortranBlock(self,components):
+    """
+    Scatters the field components of every field type into a single
+    Fortran ordered (n1, n2, ..., ncomponents) block using the linear
+    grid indices.  Each component becomes the contiguous Fortran view
+    block[...,i].
+    Args:
+      self: Standard python object oriented notation. 
+      components: The field components in the order of the block.
+    Return value:
+      None --- but rewrites the field numpy arrays.
+    """
+    grid = self.getGrid()
+    for field_type, field in self.fields.iteritems():
+      block = fzeros(grid["shape"] + (len(components),))
+      flat = np.reshape(block,(-1,len(components)),order="F") #A view of block.
+      for i, component in enumerate(components):
+        flat[grid["indices"],i] = field[component]
+        field[component] = block[...,i]
 
-      ii = ir + int(self.number_of_steps["r"]+1)*iz  
+  def getGridOrder(self):
+    """
+    Returns the coordinates of the grid, fastest varying first.
+    """
+    if self.isRZ():
+      return ["r","z"]
+    return ["x","y","z"]
 
-      fr.ravel(order='F').put(ii,field["r"]) 
-      fz.ravel(order='F').put(ii,field["z"]) 
-      
-      self.fields[field_type]["r"] = fr
-      self.fields[field_type]["z"] = fz
+  def getGrid(self):
+    """
+    Returns the grid of the current coordinates (see infer_grid),
+    inferring it if the coordinates changed since the last call.
+    Duplicate or missing nodes raise an exception, as do degenerate
+    axes (see infer_grid).
+    Args:
+      self: Standard python object oriented notation. 
+    Return value:
+      The grid dict of infer_grid.
+    """
+    if getattr(self,"grid",None) is None:
+      self.grid = infer_grid([self.coordinates[key] for key in self.getGridOrder()])
+      if self.grid["duplicates"] > 0:
+        raise Exception(self.filepath + " has " + str(self.grid["duplicates"]) + 
+                        " grid nodes with more than one point.")
+      if self.grid["missing"] > 0:
+        raise Exception(self.filepath + " has " + str(self.grid["missing"]) + 
+                        " grid nodes without a point, so the grid is incomplete.")
+    return self.grid
 
-  def archive(self, pickle_file_front=None, config=None, config_file_front=None, section="field parameters"):
+  def archive(self, pickle_file_front=None, config=None, config_file_front=None, section="field parameters",
+              binary=True):
     """
-    Saves the fields to pickle file(s) and the relevant
+    Saves the fields to binary or pickle file(s) and the relevant
     other attributes to a config file.
     Args:
       self: Standard python object oriented notation. 
-      pickle_file: Path to where the pickle file(s) will be written
+      pickle_file: Path to where the field file(s) will be written
         with the additional _electric or _magnetic.
         Default is to the original filepath without its extension.
       config: A config parser object.  If this is not defined, then one
@@ -210,15 +279,25 @@ class FieldPreProcessor(object):
         Default is to the original filepath without its extension.  If
         this is not provided, the config is written only if the config object
         is NOT provided.
+      binary: If True (default), each component is saved as a Fortran
+        ordered .npy file (_electric_x.npy, ...) that the FieldLoader
+        memory maps.  If False, each field is pickled as a dict.
     Return value:
       config: The config parser object --- but writes to the field files
         no matter what.
     """
     
+    if pickle_file_front is None:
+      pickle_file_front, file_extension = os.path.splitext(self.filepath)
     pickle_filepath = {}
+    npy_filepath = {}
     for field_type, field in self.fields.iteritems():
-      if pickle_file_front is None:
-        pickle_file_front, file_extension = os.path.splitext(self.filepath)
+      if binary:
+        for component, np_array in field.iteritems():
+          option = field_type + "_" + component + "_npy_field"
+          npy_filepath[option] = pickle_file_front + "_" + field_type + "_" + component + ".npy"
+          np.save(npy_filepath[option],np.asfortranarray(np_array))
+        continue
       pickle_filepath[field_type] = pickle_file_front + "_" + field_type + ".pckl"
       pickle.dump(field,open(pickle_filepath[field_type],"wb"))
  
@@ -229,11 +308,16 @@ class FieldPreProcessor(object):
     config.add_section(section)
     for field_type, filepath in pickle_filepath.iteritems():
       config.set(section,field_type+"_pickled_field", filepath)
+    for option, filepath in npy_filepath.iteritems():
+      config.set(section,option, filepath)
     config.set(section,"xmin", str(self.xmin))
     config.set(section,"ymin", str(self.ymin))
     config.set(section,"zmin", str(self.zmin))
     config.set(section,"zmax", str(self.zmax))
     config.set(section,"zlen", str(self.zlen))
+    config.set(section,"l4symtry", str(self.quadrant))
+    if self.isRZ():
+      config.set(section,"rmin", str(self.rmin))
     for coordinate in self.coordinates.keys():
       config.set(section, "n"+coordinate, str(int(self.number_of_steps[coordinate])))
       config.set(section, "d"+coordinate, str(self.stepsize[coordinate]))
@@ -257,50 +341,63 @@ class FieldPreProcessor(object):
     """
     return set(self.coordinates) == set(["r","z"])
 
-  def interpolateRToXY(self,r_to_xy_interpolation_function=linear_field_projection_from_r_to_xy,**kwargs):
+  def interpolateRToXY(self,r_to_xy_interpolation_function=linear_field_projection_from_r_to_xy,
+                       number_of_workers=1,quadrant=False,**kwargs):
     """
-    Passes slices of the rz field grid to the r_to_xy_interpolation function
-    and assigns the output to an xyz field grid.
+    Passes the rz field grid, as (nz, nr) arrays, to the r_to_xy_interpolation
+    function and assigns the output to an xyz field grid.
     Args:
       self: Standard python object oriented notation. 
       r_to_zy_interpolation_function: The function to be used to do the
-      x y interpolation.  Input must be the numpy arrays (r,fr,fz, x, y) and
-      output must be a numpy arrays (fx, fy, fz).
+      x y interpolation.  Input must be the numpy arrays (r,fr,fz, x, y) with
+      fr and fz of shape (nplanes, nr) and output must be a numpy arrays
+      (fx, fy, fz) of shape (nplanes, nx*ny).  It must be defined at module
+      level to be used with more than one worker.
+      number_of_workers: If more than 1, blocks of z planes of every field
+        type are projected in a process pool that writes straight into
+        the memory mapped Fortran block of the field type.
+      quadrant: If True, only the x >= 0, y >= 0 quadrant is projected.
     Return value:
       None: But unsets all "r" components, adds "x" and "y" components, 
         and reassigns both coordinates and fields to the new sized arrays.  
+        The x, y and z components of each field type are views of one
+        Fortran ordered (nx+1, ny+1, nz+1, 3) block, the layout
+        ravelXYZForFortran produces, so that step needs no copy.
     """
-    dr = self.stepsize["r"] #Just for ease of coding.
-
     #This algorithm assumes that each unique_z is matched up with each 
     #unique r (that is, the total dimensions of the grid are unique_z x unique_r
     #in the normal way).
     unique_z = np.unique(self.coordinates["z"])
     unique_r = np.unique(self.coordinates["r"])
-    unique_x, unique_y, dx, dy, nx, ny = r_mesh_to_xy_mesh(unique_r)
-    #Dicts to keep track of the output of the function
-    fx = {}
-    fy = {}
-    fz = {}
+    if unique_z.size*unique_r.size != self.coordinates["z"].size:
+      raise Exception("The rz field is not given on a full grid of its unique r and z values.")
+    unique_x, unique_y, dx, dy, nx, ny = r_mesh_to_xy_mesh(unique_r,quadrant=quadrant)
+    #Sort the points by z, then r, so each field component is an (nz, nr) array.
+    order = np.lexsort((self.coordinates["r"],self.coordinates["z"]))
+    grid_shape = (unique_z.size, unique_r.size)
+    rz_fields = {}
+    for field_type, field in self.fields.iteritems():
+      rz_fields[field_type] = (field["r"][order].reshape(grid_shape), field["z"][order].reshape(grid_shape))
 
-    for z in np.nditer(unique_z):
-      indices = np.where(self.coordinates["z"] == z)
-      for field_type, field in self.fields.iteritems():
-        #Get the constant z slice of each element we need.
-        current_fr = field["r"][indices]
-        current_fz = field["z"][indices]
-        #Pass control to the interpolation function
-        fx_piece, fy_piece, fz_piece = \
-            r_to_xy_interpolation_function(unique_r, current_fr, current_fz, unique_x, unique_y)
-        #Add the piece just calculated to object that keeps track of it.
-        try:
-          fx[field_type].append(fx_piece)
-          fy[field_type].append(fy_piece)
-          fz[field_type].append(fz_piece)
-        except KeyError:
-          fx[field_type]=[fx_piece]
-          fy[field_type]=[fy_piece]
-          fz[field_type]=[fz_piece]
+    #x cycles fastest in the xy mesh, so a C order (3, nz, nx*ny) array is
+    #the memory of the Fortran (nx, ny, nz, 3) block and .T is that block.
+    block_shape = (nx+1, ny+1, unique_z.size, 3)
+    if number_of_workers > 1:
+      blocks = project_r_to_xy_in_parallel(r_to_xy_interpolation_function, unique_r, rz_fields,
+                                           unique_x, unique_y, number_of_workers)
+    else:
+      blocks = {}
+      for field_type, (fr, fz) in rz_fields.iteritems():
+        blocks[field_type] = fzeros(block_shape)
+        planes = blocks[field_type].T.reshape(3, unique_z.size, unique_x.size) #A view of the block.
+        for i, piece in enumerate(r_to_xy_interpolation_function(unique_r, fr, fz, unique_x, unique_y)):
+          planes[i] = piece
+    for field_type, block in blocks.iteritems():
+      block = np.reshape(block, block_shape, order="F")
+      for i, component in enumerate(["x","y","z"]):
+        self.fields[field_type][component] = block[...,i]
+      del self.fields[field_type]["r"]
+    self.fortran_block = True
 
     #Overwrite the elements with the new numpy arrays and values
     self.coordinates["x"] = np.tile(unique_x,unique_z.size)
@@ -311,19 +408,73 @@ class FieldPreProcessor(object):
     self.number_of_steps["x"] = nx
     self.number_of_steps["y"] = ny
 
-
-    #Concatenate the arrays into single array and save.
-    for field_type in self.fields.keys():
-      self.fields[field_type]["x"] = np.hstack(fx[field_type])
-      self.fields[field_type]["y"] = np.hstack(fy[field_type])
-      self.fields[field_type]["z"] = np.hstack(fz[field_type])
-
     #Delete the unnecesary r components
+    self.grid = None #The points change.
     del self.coordinates["r"]
     del self.stepsize["r"]
     del self.number_of_steps["r"]
-    for field_type, field in self.fields.iteritems():
-      del self.fields[field_type]["r"]
+
+def project_r_to_xy_in_parallel(r_to_xy_interpolation_function, r_array, rz_fields, x_array, y_array,
+                                number_of_workers, planes_per_task=None):
+  """
+  Projects blocks of z planes of every field type in a process pool.
+  Each worker writes its planes into a (3, nz, nx*ny) .npy file per field
+  type memory mapped by all processes.  Its memory is the Fortran ordered
+  (nx, ny, nz, 3) block of the field, so no pieces are collected, stacked
+  or scattered.  The files are unlinked once mapped, so the arrays live
+  only as long as they are used.
+  Args:
+    r_to_xy_interpolation_function: See FieldPreProcessor.interpolateRToXY.
+    r_array: The sorted unique r values.
+    rz_fields: A dict keyed by field type of (fr, fz) arrays of shape (nz, nr).
+    x_array, y_array: The x y points onto which we plan on projecting.
+    number_of_workers: The number of processes in the pool.
+    planes_per_task: The number of z planes per task.  Default splits each
+      field type in about 4 tasks per worker.
+  Return value:
+    A dict keyed by field type of the Fortran ordered (nx, ny, nz, 3)
+    views of the memory mapped outputs.
+  """
+  scratch_directory = tempfile.mkdtemp(prefix="field_preprocessor_")
+  tasks = []
+  output_paths = {}
+  try:
+    for field_type, (fr, fz) in rz_fields.iteritems():
+      nz = fr.shape[0]
+      output_paths[field_type] = os.path.join(scratch_directory, field_type + ".npy")
+      np.lib.format.open_memmap(output_paths[field_type], mode="w+", dtype=np.float64,
+                                shape=(3,nz,x_array.size))
+      step = planes_per_task or max(1, int(np.ceil(float(nz)/(4*number_of_workers))))
+      for start in range(0, nz, step):
+        stop = min(start+step, nz)
+        tasks.append((r_to_xy_interpolation_function, r_array, fr[start:stop], fz[start:stop],
+                      x_array, y_array, output_paths[field_type], start))
+    pool = multiprocessing.Pool(number_of_workers)
+    try:
+      for _ in pool.imap_unordered(project_r_to_xy_planes, tasks):
+        pass
+    finally:
+      pool.close()
+      pool.join()
+    output = {}
+    for field_type, path in output_paths.iteritems():
+      output[field_type] = np.load(path, mmap_mode="r+").T
+  finally:
+    shutil.rmtree(scratch_directory)
+  return output
+
+def project_r_to_xy_planes(task):
+  """
+  Worker of project_r_to_xy_in_parallel: projects a block of z planes and
+  writes them into planes start:start+nplanes of the memory mapped output.
+  """
+  r_to_xy_interpolation_function, r_array, fr, fz, x_array, y_array, output_path, start = task
+  pieces = r_to_xy_interpolation_function(r_array, fr, fz, x_array, y_array)
+  output = np.load(output_path, mmap_mode="r+")
+  for i, piece in enumerate(pieces):
+    output[i,start:start+piece.shape[0]] = piece
+  output.flush()
+  del output
         
 
 def read_file_as_dict_of_numpy_arrays(filepath,formattype=""):
@@ -1,6 +1,7 @@
 import csv
 from warp import *
-from fields.standard import count_lines, convert_list_of_dicts_to_dict_of_numpy_arrays
+import numpy
+from fields.standard import count_lines, read_numeric_blocks, read_numeric_columns
 
 """
 Don't know what to call this fie type, so I am calling it rf ascii.
@@ -8,30 +9,79 @@ Essentially it is just 2 header lines plus the data.  The first is the
 fieldnames, the second is the dimensions, and the third on is the data.
 """
 
-def read_rf_ascii_file_as_numpy_arrays(dat_file):
+unit_conversions = {"mm": 0.001, "cm": 0.01, "MV/m": 1000000}
+
+def read_rf_ascii_file_as_numpy_arrays(dat_file,chunk_bytes=2**24):
   """
-  Wraps the read_rf_ascii_file function so that the "data"
-  output field is now a dictionary of numpy arrays instead of 
-  a list of dicts.
+  Reads a rf ascii field file (as given to me by Chung-Yu Ruan)
+  straight into numpy arrays.  The body is parsed in blocks into
+  one preallocated array and the units are converted with a single
+  broadcast multiply.  All fieldnames will be in lower case only.
+  A value that is not a number, or data lines after the footer,
+  raise an exception instead of cutting the field map short.
   Args:
     dat_file: File with the .dat extension taken from the output
       of Poisson (I think)
+    chunk_bytes: The approximate number of bytes of text parsed at once.
   Return value:
     output: Dictionary with the keys
       fieldnames: The keys of the dictionary in the order they
         appear in the file.
       data: A dictionary of numpy arrays keyed by the fieldnames.
   """
-  output = read_rf_ascii_file(dat_file)
-  output["data"] = convert_list_of_dicts_to_dict_of_numpy_arrays(output["data"])
+  output = {}
+  max_rows = count_lines(dat_file) - 2
+  with open(dat_file,"r") as f:
+    output["fieldnames"], unit_conversion = read_rf_ascii_header(f)
+    table = read_numeric_columns(f,len(output["fieldnames"]),max(max_rows,0),chunk_bytes,
+                                 dat_file,stop_at_short_line=True)
+  table *= unit_conversion[:,numpy.newaxis]
+  output["data"] = dict(zip(output["fieldnames"],table))
   return output
 
+def iterate_rf_ascii_file(dat_file,chunk_bytes=2**24):
+  """
+  Generator over a rf ascii field file that yields the data in blocks
+  of about chunk_bytes of text, so that large 3D maps can be processed
+  without holding the file in memory.  Units are converted.  Corrupt
+  data raises an exception as in read_rf_ascii_file_as_numpy_arrays.
+  Args:
+    dat_file: The rf ascii file.
+    chunk_bytes: The approximate number of bytes of text parsed at once.
+  Yields:
+    A dictionary of numpy arrays keyed by the lower case fieldnames.
+  """
+  with open(dat_file,"r") as f:
+    fieldnames, unit_conversion = read_rf_ascii_header(f)
+    for block in read_numeric_blocks(f,len(fieldnames),chunk_bytes,dat_file,
+                                     stop_at_short_line=True):
+      block *= unit_conversion
+      yield dict([(fieldnames[i],block[:,i].copy()) for i in range(len(fieldnames))])
+
+def read_rf_ascii_header(f):
+  """
+  Reads the 2 header lines of an open rf ascii file, leaving f at the
+  first data line.
+  Return value:
+    (fieldnames, unit_conversion): The lower case fieldnames and a numpy
+      array of the factor converting each column to SI units.
+  """
+  #Get fieldnames (keys from header)
+  fieldnames = f.readline().strip().lower().split()
+  #Read the next line and get the conversions.
+  line = f.readline().strip()
+  pieces = line.split()
+  pieces = [p.replace("(","").replace(")","") for p in pieces] 
+  unit_conversion = numpy.array([unit_conversions.get(p,1) for p in pieces],dtype=numpy.float64)
+  return (fieldnames, unit_conversion)
+
 def read_rf_ascii_file(dat_file):
   """
   Reads a rf ascii field file (as given to me by Chung-Yu Ruan)
   returning an object with elements data.  The
   data will be returned a list of dicts with the header
   fieldnames as keys.  All fieldnames will be in lower case only.
+  Prefer read_rf_ascii_file_as_numpy_arrays for large files.
   Args:
     dat_file: File with the .dat extension taken from the output
       of Poisson (I think)
@@ -42,35 +92,7 @@ def read_rf_ascii_file(dat_file):
       data: A table (rows of dicts) keyed by whatever is in
         the header.
   """
-  output = {}
-  with open(dat_file,"r") as f:
-    #Get fieldnames (keys from header)
-    output["fieldnames"] = f.readline().strip().lower().split()
-    #Read the next line and get the conversions.
-    line = f.readline().strip()
-    pieces = line.split()
-    pieces = [p.replace("(","").replace(")","") for p in pieces] 
-    unit_conversion = []
-    for p in pieces:
-      if p == "mm":
-        unit_conversion.append(0.001)
-      elif p == "cm":
-        unit_conversion.append(0.01)
-      elif p == "MV/m":
-        unit_conversion.append(1000000)
-      else:
-        unit_conversion.append(1)
-    #Load data as floats.
-    table = []
-    for line in f:
-      line = line.strip()
-      pieces = line.split()
-      #End when there is no longer any data.  This file type contains a footer.
-      if len(pieces) <= 1:
-        break
-      pieces = [float(p) for p in pieces]
-      converted_pieces = [pieces[i]*unit_conversion[i] for i in range(len(pieces))]
-      row = dict(zip(output["fieldnames"],converted_pieces))
-      table.append(row)
-    output["data"] = table
+  output = read_rf_ascii_file_as_numpy_arrays(dat_file)
+  columns = [output["data"][fieldname] for fieldname in output["fieldnames"]]
+  output["data"] = [dict(zip(output["fieldnames"],row)) for row in zip(*columns)]
   return output
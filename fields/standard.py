@@ -48,3 +48,134 @@ def convert_list_of_dicts_to_dict_of_numpy_arrays(list_of_dicts):
   for key, value_list in dict_of_lists.iteritems():
     output[key] = numpy.array(value_list)
   return output
+
+def parse_numbers(text,filepath="the file",number_of_tokens=None):
+  """
+  Parses whitespace separated numbers into a float64 array in one call.
+  numpy.fromstring stops at the first token that is not a number, so the
+  parsed count is compared with the token count and an exception is raised
+  when they differ.
+  Args:
+    text: The text to parse.
+    filepath: The name used in error messages.
+    number_of_tokens: The number of whitespace separated tokens of the
+      text if already known.
+  Return value:
+    A float64 numpy array of the numbers.
+  """
+  if number_of_tokens is None:
+    number_of_tokens = len(text.split())
+  if number_of_tokens == 0: #fromstring returns [-1.] for blank text.
+    return numpy.empty(0)
+  values = numpy.fromstring(text,dtype=numpy.float64,sep=" ")
+  if values.size != number_of_tokens:
+    raise Exception("Found a value that is not a number in " + filepath + " after " +
+                    str(values.size) + " of the " + str(number_of_tokens) + " values of a block.")
+  return values
+
+def cut_at_short_line(text):
+  """
+  Returns (head, found) where head is the text before the first line
+  with at most one token and found tells whether there was such a line.
+  """
+  position = 0
+  for line in text.splitlines(True):
+    if len(line.split()) <= 1:
+      return (text[:position], True)
+    position += len(line)
+  return (text, False)
+
+def check_after_short_line(text,number_of_columns,filepath="the file"):
+  """
+  Raises an exception if a line of the text following the short line that
+  ended the data holds number_of_columns numbers, since that data would
+  otherwise be dropped without notice.
+  """
+  for line in text.splitlines():
+    tokens = line.split()
+    if len(tokens) != number_of_columns:
+      continue
+    try:
+      [float(token) for token in tokens]
+    except ValueError:
+      continue
+    raise Exception("Found data lines after a line with at most one value in " + filepath +
+                    ".  The data would be cut at that line.")
+
+def read_numeric_blocks(f,number_of_columns,chunk_bytes=2**24,filepath="the file",
+                        stop_at_short_line=False,delimiter=" "):
+  """
+  Generator that parses whitespace separated numbers from the current
+  position of the open file f to its end, in blocks of about chunk_bytes
+  of text cut at line boundaries.  A token that is not a number raises
+  an exception (see parse_numbers).
+  Args:
+    f: An open file positioned at the first data line.
+    number_of_columns: The number of values on each line.
+    chunk_bytes: The approximate number of bytes of text parsed at once.
+    filepath: The name used in error messages.
+    stop_at_short_line: If True, reading ends at the first line with at
+      most one token, like the footer of rf ascii files.  Blocks are only
+      scanned line by line when their token count shows such a line.
+      Data lines after that line raise an exception.
+    delimiter: The string separating the columns, replaced by a space
+      before parsing.
+  Yields:
+    A (k,number_of_columns) float64 numpy array per block.
+  """
+  remainder = ""
+  while True:
+    block = f.read(chunk_bytes)
+    if block == "":
+      text = remainder
+    else:
+      last_newline = block.rfind("\n")
+      if last_newline == -1:
+        remainder += block
+        continue
+      text = remainder + block[:last_newline+1]
+      remainder = block[last_newline+1:]
+    if delimiter.strip() != "":
+      text = text.replace(delimiter," ")
+    number_of_tokens = len(text.split())
+    stopped = False
+    if stop_at_short_line:
+      number_of_lines = text.count("\n") + (0 if text.endswith("\n") or text == "" else 1)
+      if number_of_tokens != number_of_lines*number_of_columns:
+        head, stopped = cut_at_short_line(text)
+        if stopped:
+          check_after_short_line(text[len(head):] + remainder + f.read(),number_of_columns,filepath)
+        text = head
+        number_of_tokens = len(text.split())
+    values = parse_numbers(text,filepath,number_of_tokens)
+    if values.size % number_of_columns != 0:
+      raise Exception("The format of " + filepath + " is inconsistent.  " +
+                      "Expected " + str(number_of_columns) + " values on every line.")
+    if values.size > 0:
+      yield values.reshape(-1,number_of_columns)
+    if block == "" or stopped:
+      break
+
+def read_numeric_columns(f,number_of_columns,max_rows,chunk_bytes=2**24,filepath="the file",
+                         stop_at_short_line=False):
+  """
+  Parses the rest of the open file f into a single (number_of_columns, n)
+  float64 array filled block by block, so that each column is contiguous
+  and the peak memory is the final array plus one block of text.
+  Args:
+    f, number_of_columns, chunk_bytes, filepath, stop_at_short_line: See
+      read_numeric_blocks.
+    max_rows: An upper bound on the number of data lines, e.g. from
+      count_lines.  Blank lines make the bound loose; the returned
+      array is then a view of the filled part.
+  Return value:
+    The (number_of_columns, n) array with one row per column of the file.
+  """
+  table = numpy.empty((number_of_columns,max_rows),dtype=numpy.float64)
+  n = 0
+  for block in read_numeric_blocks(f,number_of_columns,chunk_bytes,filepath,stop_at_short_line):
+    if n + block.shape[0] > max_rows:
+      raise Exception("More data lines than expected in " + filepath + ".")
+    table[:,n:n+block.shape[0]] = block.T
+    n += block.shape[0]
+  return table[:,:n]
@@ -0,0 +1,114 @@
+import argparse
+import numpy as np
+
+"""
+The injection plan maps every global step of the adv_dt/adv_steps schedule
+to the [start, stop) range of the birth time sorted particles injected on
+that step, so that it can be worked out once before the run and the
+injection itself only slices.  The counts per step are the histogram of
+the emission over the schedule, which helps to tune the dt schedule.
+"""
+
+def get_step_times(adv_dt,adv_steps,start_time=0.):
+  """
+  Returns the nsteps + 1 times of the step boundaries of the schedule.
+  The dts are summed one at a time, like top.time, so that the boundaries
+  match the times seen during the run.
+  Args:
+    adv_dt: A number or numpy array of dts.
+    adv_steps: A number or numpy array with the number of steps for each dt.
+    start_time: The time at the start of the first step.
+  """
+  adv_dt = np.atleast_1d(np.asarray(adv_dt,dtype=np.float64))
+  adv_steps = np.atleast_1d(np.asarray(adv_steps)).astype(np.int64)
+  if adv_dt.shape != adv_steps.shape:
+    raise Exception("adv_dt and adv_steps need the same number of entries.")
+  dts = np.repeat(adv_dt,adv_steps)
+  return np.cumsum(np.concatenate([[start_time],dts]))
+
+def calc_injection_plan(t,adv_dt,adv_steps,start_time=0.):
+  """
+  Works out which particles are injected on each step.  Step i injects the
+  particles born in (step_times[i], step_times[i+1]], as steves_injectelectrons
+  does with (top.time, top.time + top.dt].
+  Args:
+    t: The birth times of the particles sorted in increasing order.
+    adv_dt, adv_steps, start_time: See get_step_times.
+  Return value:
+    A dict with the keys step_times (nsteps+1), starts, stops and counts
+    (nsteps each), and before and after, the number of particles born at or
+    before the start of the schedule or after its end, which are never injected.
+  """
+  step_times = get_step_times(adv_dt,adv_steps,start_time)
+  boundaries = np.searchsorted(t,step_times,side="right")
+  plan = {}
+  plan["step_times"] = step_times
+  plan["starts"] = boundaries[:-1]
+  plan["stops"] = boundaries[1:]
+  plan["counts"] = np.diff(boundaries)
+  plan["before"] = int(boundaries[0])
+  plan["after"] = int(len(t) - boundaries[-1])
+  return plan
+
+def get_plan_step(plan,time,dt):
+  """
+  Returns the index of the step of the plan that runs from time to
+  time + dt, or None if the time is outside of the plan.  The middle of
+  the step is searched so that rounding of time does not matter.
+  """
+  step = np.searchsorted(plan["step_times"],time + 0.5*dt) - 1
+  if step < 0 or step >= len(plan["starts"]):
+    return None
+  return step
+
+def write_injection_plan(plan,filepath):
+  """
+  Writes the plan to one file: a compressed .npz with every array if the
+  filepath ends with .npz, otherwise an ascii table with one line per step.
+  """
+  if filepath.endswith(".npz"):
+    np.savez_compressed(filepath,**plan)
+    return
+  names = ["step","time_start","time_stop","start","stop","count"]
+  nsteps = len(plan["starts"])
+  table = np.column_stack([np.arange(nsteps),plan["step_times"][:-1],plan["step_times"][1:],
+                           plan["starts"],plan["stops"],plan["counts"]])
+  np.savetxt(filepath,table,fmt=["%d","%.8e","%.8e","%d","%d","%d"],
+             header=" ".join(names),comments="")
+
+def print_injection_histogram(plan,adv_dt,adv_steps,width=50):
+  """
+  Prints the number of particles injected in each dt segment of the
+  schedule with a bar, and the busiest step of each segment.
+  """
+  adv_steps = np.atleast_1d(np.asarray(adv_steps)).astype(np.int64)
+  adv_dt = np.atleast_1d(adv_dt)
+  edges = np.concatenate([[0],np.cumsum(adv_steps)])
+  totals = [int(np.sum(plan["counts"][edges[i]:edges[i+1]])) for i in range(len(adv_steps))]
+  largest = max(max(totals),1)
+  print "Born before the first step: " + str(plan["before"])
+  for i in range(len(adv_steps)):
+    segment = plan["counts"][edges[i]:edges[i+1]]
+    busiest = int(np.max(segment)) if len(segment) > 0 else 0
+    print ("dt = %.3e s, steps %d to %d: %d particles, at most %d per step " %
+           (adv_dt[i],edges[i],edges[i+1]-1,totals[i],busiest)) + "#"*int(width*totals[i]/largest)
+  print "Born after the last step: " + str(plan["after"])
+
+if __name__ == "__main__":
+  from config.my_config import MyConfigParser
+  from injectors.io import phase_volume_loader
+  parser = argparse.ArgumentParser(description='Works out the injection plan, the particles injected on every step of the adv_dt/adv_steps schedule, of an initial conditions file and prints the number of particles injected per dt segment.')
+  parser.add_argument('input_file', type=str, help='The path to the file containing the intial conditions pickled dictionary or to a columnar initial conditions directory.')
+  parser.add_argument('config_file', type=str, help='The simulation config file with the adv_dt and adv_steps parameters.')
+  parser.add_argument('-o','--output', dest="output", type=str, help='Writes the plan to this file.  A .npz extension stores every array, anything else writes an ascii table.  Default is to only print the histogram.', default=None)
+  args = parser.parse_args()
+
+  config = MyConfigParser()
+  config.read(args.config_file)
+  adv_dt = config.get("Simulation parameters", "adv_dt")
+  adv_steps = config.get("Simulation parameters", "adv_steps")
+  t = np.sort(phase_volume_loader(args.input_file)[0])
+  plan = calc_injection_plan(t,adv_dt,adv_steps)
+  print_injection_histogram(plan,adv_dt,adv_steps)
+  if args.output is not None:
+    write_injection_plan(plan,args.output)
@@ -1,11 +1,15 @@
+import numpy
 from fundamental_classes.user_event import UserEvent
-from injectors.io import phase_volume_pickle_loader
+from injectors.injection_plan import calc_injection_plan, get_plan_step
+from injectors.io import phase_volume_loader, InitialConditionStream
 from warp import * #Need for species
 class ElectronInjector(UserEvent):
   """
   A class to provide the interface with the the injector
   set up in warp.  This is a little more 
   transparent then using UserEvent by itself.
+  The particles are sorted by birth time once, and a cursor
+  into the sorted arrays hands each step only its own batch.
   """
 
   def __init__(self, callback, top, filepath,
@@ -29,12 +33,71 @@ class ElectronInjector(UserEvent):
         the callback function.  This is meant to hold True/False flags.
     """
     self.callback = callback
-    t, x, y, z, px, py, pz = phase_volume_pickle_loader(filepath,**kwargs)
+    t, x, y, z, px, py, pz = phase_volume_loader(filepath,**kwargs)
+    if numpy.any(t[1:] < t[:-1]): #Columnar inputs are usually already sorted.
+      order = numpy.argsort(t,kind="mergesort")
+      t, x, y, z, px, py, pz = [a[order] for a in [t, x, y, z, px, py, pz]]
+    self.cursor = None #Index of the first particle not yet injected.
+    self.plan = None #Set by makeInjectionPlan.
     electrons = Species(type=Electron,weight=weight,name="Electron")
     args=[top, t, x, y, z, px, py, pz, chage_mass_ratio, electrons, flags]
     UserEvent.__init__(self,callback,args) #This partially freezes the attributes
 
-  #def callFunction(self): This method is inherited from UserEvent
+  def callFunction(self):
+    """
+    Calls the callback with contiguous slices of the time sorted
+    arrays holding only the particles born in (top.time, top.time + top.dt],
+    found by a binary search from the cursor.  The cost per step is
+    O(k + log N) for k injected out of N particles.
+    When an injection plan has been made, the slice of the step is
+    looked up in the plan instead.
+    Args:
+      self: The ElectronInjector object --- standard notation
+        for object oriented python.
+    """
+    top = self.args[0]
+    if self.cursor is None:
+      self.cursor = self.searchBirthTime(top.time)
+    step = None
+    if self.plan is not None:
+      step = get_plan_step(self.plan,top.time,top.dt)
+    if step is None:
+      stop = self.searchBirthTime(top.time + top.dt)
+    else:
+      stop = self.plan["stops"][step]
+    if stop <= self.cursor:
+      return
+    args = list(self.args)
+    args[1:8] = self.getBatch(self.cursor,stop) #t, x, y, z, px, py, pz
+    self.cursor = stop
+    self.callback(*args)
+
+  def searchBirthTime(self,time):
+    """
+    Returns the number of particles born at or before the time.
+    """
+    return numpy.searchsorted(self.args[1],time,side="right")
+
+  def getBatch(self,start,stop):
+    """
+    Returns the list of t, x, y, z, px, py, pz slices of the particles
+    start to stop.
+    """
+    return [self.args[i][start:stop] for i in range(1,8)]
+
+  def makeInjectionPlan(self,adv_dt,adv_steps,start_time=0.):
+    """
+    Works out the slice of the sorted particles injected on every step
+    of the adv_dt/adv_steps schedule before the run.
+    Args:
+      self: The ElectronInjector object --- standard notation
+        for object oriented python.
+      adv_dt, adv_steps, start_time: See injection_plan.get_step_times.
+    Return value:
+      The plan dict of injection_plan.calc_injection_plan.
+    """
+    self.plan = calc_injection_plan(self.args[1],adv_dt,adv_steps,start_time)
+    return self.plan
 
   def getElectronContainer(self):
     """
@@ -47,6 +110,61 @@ class ElectronInjector(UserEvent):
     """
     return self.args[9]
 
+class StreamingElectronInjector(ElectronInjector):
+  """
+  An ElectronInjector that streams the particles from a time sorted
+  columnar initial conditions directory instead of loading them all,
+  so the resident memory is bounded by the chunk size rather than the
+  number of particles.  The chunk ahead of top.time is read in a
+  background thread.
+  """
+
+  def __init__(self, callback, top, directory,
+               chage_mass_ratio, weight, flags={}, chunk_particles=2**20, **kwargs):
+    """
+    Args:
+      self: The StreamingElectronInjector object --- standard notation
+        for object oriented python.
+      callback, top, chage_mass_ratio, weight, flags: See ElectronInjector.
+      directory: The time sorted columnar initial conditions directory,
+        see injectors.io.write_initial_condition_columns.
+      chunk_particles: The number of particles read from the disk at once.
+      kwargs: The coordinate conversions of InitialConditionStream.
+    """
+    self.callback = callback
+    self.stream = InitialConditionStream(directory,chunk_particles,**kwargs)
+    self.cursor = None #Index of the first particle not yet injected.
+    self.plan = None #Set by makeInjectionPlan.
+    self.stream.startPrefetch(self.searchBirthTime(top.time)//self.stream.chunk_particles)
+    electrons = Species(type=Electron,weight=weight,name="Electron")
+    args=[top, None, None, None, None, None, None, None, chage_mass_ratio, electrons, flags]
+    UserEvent.__init__(self,callback,args) #This partially freezes the attributes
+
+  def searchBirthTime(self,time):
+    """
+    Returns the number of particles born at or before the time.
+    """
+    return self.stream.searchTime(time)
+
+  def getBatch(self,start,stop):
+    """
+    Returns the list of t, x, y, z, px, py, pz arrays of the particles
+    start to stop read from the stream.
+    """
+    return list(self.stream.getSlice(start,stop))
+
+  def makeInjectionPlan(self,adv_dt,adv_steps,start_time=0.):
+    """
+    See ElectronInjector.makeInjectionPlan.  The plan is worked out on
+    the memory mapped time column in its own units.
+    """
+    time_conversion = self.stream.conversions[0]
+    self.plan = calc_injection_plan(self.stream.getBirthTimes(),
+                  numpy.asarray(adv_dt,dtype=numpy.float64)/time_conversion,
+                  adv_steps,start_time/time_conversion)
+    self.plan["step_times"] = self.plan["step_times"]*time_conversion
+    return self.plan
+
 class SingleElectronInjector(UserEvent):
   """
   Wraps the single injection (the whole ensemble) of electrons into 
@@ -1,5 +1,17 @@
+import argparse
+import os
+import threading
 import numpy
 import cPickle as pickle
+from ConfigParser import RawConfigParser
+from coordinates.kinematics import lorentz_gamma_from_momentum
+
+#The keys of the initial conditions and the units of the legacy pickled dicts.
+initial_condition_keys = ["t","x","y","z","px","py","pz"]
+default_units = {"t": "s", "x": "m", "y": "m", "z": "m", 
+                 "px": "MeV/c", "py": "MeV/c", "pz": "MeV/c"}
+#The header of a columnar initial conditions directory.
+columns_header_filename = "header.cfg"
 
 def phase_volume_pickle_loader(pickle_dict_file,time_conversion=1.,
           position_conversion=1.,momentum_conversion=1.,**kwargs):
@@ -14,35 +26,243 @@ def phase_volume_pickle_loader(pickle_dict_file,time_conversion=1.,
     (t,x,y,z,px,py,pz) : The phase coordinates for the N particles
       stored as single dimensioned numpy arrays. 
   """
-  ff = open(pickle_dict_file, 'r')
+  columns = read_pickle_dict_columns(pickle_dict_file)
+  return convert_columns(columns,time_conversion,position_conversion,momentum_conversion)
+
+def read_pickle_dict_columns(pickle_dict_file):
+  """
+  Reads the pickled list of per particle dicts into a dict of float64
+  numpy arrays keyed by t, x, y, z, px, py and pz.
+  """
+  ff = open(pickle_dict_file, 'rb')
   dd = pickle.load(ff)
   ff.close() 
+  columns = {}
+  for key in initial_condition_keys:
+    columns[key] = numpy.fromiter((row[key] for row in dd),dtype=numpy.float64,count=len(dd))
+  return columns
+
+def convert_columns(columns,time_conversion=1.,position_conversion=1.,momentum_conversion=1.):
+  """
+  Returns the tuple (t,x,y,z,px,py,pz) of the columns multiplied by the
+  conversions.  Columns with a conversion of 1 are returned as they are,
+  so memory mapped columns stay memory mapped.
+  """
+  conversions = {"t": time_conversion,
+                 "x": position_conversion, "y": position_conversion, "z": position_conversion,
+                 "px": momentum_conversion, "py": momentum_conversion, "pz": momentum_conversion}
+  output = []
+  for key in initial_condition_keys:
+    if conversions[key] == 1.:
+      output.append(columns[key])
+    else:
+      output.append(columns[key]*conversions[key])
+  return tuple(output)
+
+def phase_volume_columns_loader(directory,time_conversion=1.,
+          position_conversion=1.,momentum_conversion=1.,mmap_mode="r",**kwargs):
+  """
+  Read in the initial conditions data stored in the columnar format: a
+  directory with one .npy file per key and a header.cfg with the units
+  and the number of particles (see write_initial_condition_columns).
+  The columns are memory mapped, so the load time does not grow with N.
+  Args:
+    directory: The columnar initial conditions directory.
+    *_conversion: Will multiply the corresponding coordinates
+      to convert them to appropriate coordinates
+    mmap_mode: The numpy.load memory map mode.  None reads the arrays
+      into memory.
+  Return value:
+    (t,x,y,z,px,py,pz) : The phase coordinates for the N particles
+      stored as single dimensioned numpy arrays. 
+  """
+  header = read_initial_condition_header(directory)
+  columns = {}
+  for key in initial_condition_keys:
+    columns[key] = numpy.load(os.path.join(directory,key + ".npy"),mmap_mode=mmap_mode)
+    if columns[key].shape != (header["number_of_particles"],):
+      raise Exception("The " + key + " column of " + directory + " does not hold " +
+                      str(header["number_of_particles"]) + " particles.")
+  return convert_columns(columns,time_conversion,position_conversion,momentum_conversion)
+
+def phase_volume_loader(filepath,**kwargs):
+  """
+  Dispatches to phase_volume_columns_loader when the filepath is a
+  columnar initial conditions directory and to phase_volume_pickle_loader
+  otherwise.
+  """
+  if os.path.isdir(filepath):
+    return phase_volume_columns_loader(filepath,**kwargs)
+  return phase_volume_pickle_loader(filepath,**kwargs)
+
+def read_initial_condition_header(directory):
+  """
+  Returns the header of a columnar initial conditions directory as a dict
+  with the keys number_of_particles, sorted_by_time and units (a dict of
+  the unit string of each key).
+  """
+  config = RawConfigParser()
+  if config.read(os.path.join(directory,columns_header_filename)) == []:
+    raise Exception(directory + " is not a columnar initial conditions directory.")
+  header = {}
+  header["number_of_particles"] = config.getint("Columns","number_of_particles")
+  header["sorted_by_time"] = config.getboolean("Columns","sorted_by_time")
+  header["units"] = dict(config.items("Units"))
+  return header
+
+def write_initial_condition_columns(columns,directory,units=default_units,sort_by_time=True):
+  """
+  Writes the initial conditions in the columnar format: one float64 .npy
+  file per key and a header.cfg with the units.
+  Args:
+    columns: A dict of numpy arrays keyed by t, x, y, z, px, py and pz.
+    directory: The directory to write.  It is made if it does not exist.
+    units: A dict of the unit string of each key for the header.
+    sort_by_time: If True, the particles are stably sorted by t first
+      so that the injectors can use the columns without permuting them.
+  """
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  n = len(columns["t"])
+  order = None
+  if sort_by_time:
+    order = numpy.argsort(columns["t"],kind="mergesort")
+  for key in initial_condition_keys:
+    column = numpy.asarray(columns[key],dtype=numpy.float64)
+    if column.shape != (n,):
+      raise Exception("The " + key + " column does not hold " + str(n) + " particles.")
+    if order is not None:
+      column = column[order]
+    numpy.save(os.path.join(directory,key + ".npy"),column)
+  config = RawConfigParser()
+  config.add_section("Columns")
+  config.set("Columns","number_of_particles",str(n))
+  config.set("Columns","sorted_by_time",str(sort_by_time))
+  config.add_section("Units")
+  for key in initial_condition_keys:
+    config.set("Units",key,units[key])
+  with open(os.path.join(directory,columns_header_filename),"w") as f:
+    config.write(f)
+
+def convert_pickle_to_columns(pickle_dict_file,directory,units=default_units):
+  """
+  Converts a legacy pickled list of per particle dicts, like
+  InitCond_10000x100e_dict.pckl, to the columnar format.
+  """
+  write_initial_condition_columns(read_pickle_dict_columns(pickle_dict_file),directory,units)
+
 
-  # --- create ... arrays to store data  
-  n  = len(dd)
-  t  = numpy.zeros(n)  
-  x  = numpy.zeros(n) 
-  y  = numpy.zeros(n) 
-  z  = numpy.zeros(n) 
-  px = numpy.zeros(n) 
-  py = numpy.zeros(n) 
-  pz = numpy.zeros(n) 
-
-  # --- place data in ... arrays.   
-  for ii in range(n):
-    row = dd[ii]
-    t[ii] = row['t']*time_conversion
-    #
-    x[ii] = row['x']*position_conversion
-    y[ii] = row['y']*position_conversion
-    z[ii] = row['z']*position_conversion
-    # 
-    px[ii] = row['px']*momentum_conversion 
-    py[ii] = row['py']*momentum_conversion
-    pz[ii] = row['pz']*momentum_conversion
-
-  return (t,x,y,z,px,py,pz)
+class InitialConditionStream(object):
+  """
+  Reads a time sorted columnar initial conditions directory in chunks of
+  particles from its memory mapped columns.  The chunk after the one in
+  use is read in a background thread, so at most two chunks are resident
+  however many particles the directory holds.
+  """
+
+  def __init__(self,directory,chunk_particles=2**20,time_conversion=1.,
+               position_conversion=1.,momentum_conversion=1.,prefetch=True,**kwargs):
+    """
+    Args:
+      directory: The columnar initial conditions directory.  It has to
+        be sorted by time, as written by write_initial_condition_columns.
+      chunk_particles: The number of particles read at once.
+      *_conversion: Will multiply the corresponding coordinates
+        to convert them to appropriate coordinates
+      prefetch: If False, the chunks are only read when they are needed.
+    """
+    header = read_initial_condition_header(directory)
+    if not header["sorted_by_time"]:
+      raise Exception(directory + " is not sorted by time.  Rewrite it with " +
+                      "write_initial_condition_columns to stream it.")
+    self.number_of_particles = header["number_of_particles"]
+    self.columns = dict([(key,numpy.load(os.path.join(directory,key + ".npy"),mmap_mode="r"))
+                         for key in initial_condition_keys])
+    self.chunk_particles = int(chunk_particles)
+    self.conversions = (time_conversion, position_conversion, momentum_conversion)
+    self.prefetch = prefetch
+    self.chunk_index = None
+    self.chunk = None
+    self.prefetch_index = None
+    self.prefetch_thread = None
+    self.prefetch_result = {}
+
+  def getBirthTimes(self):
+    """
+    Returns the memory mapped, unconverted birth time column.
+    """
+    return self.columns["t"]
+
+  def searchTime(self,time):
+    """
+    Returns the number of particles born at or before the time in
+    O(log N) reads of the memory mapped time column.
+    """
+    return numpy.searchsorted(self.columns["t"],time/self.conversions[0],side="right")
 
+  def readChunk(self,index):
+    """
+    Reads the chunk of the index into memory and returns the converted
+    (t,x,y,z,px,py,pz) arrays.
+    """
+    start = index*self.chunk_particles
+    stop = min(start + self.chunk_particles,self.number_of_particles)
+    columns = dict([(key,self.columns[key][start:stop]) for key in initial_condition_keys])
+    return tuple([numpy.array(c) if isinstance(c,numpy.memmap) else c
+                  for c in convert_columns(columns,*self.conversions)])
+
+  def startPrefetch(self,index):
+    """
+    Starts reading the chunk of the index in a background thread.
+    """
+    if not self.prefetch or index*self.chunk_particles >= self.number_of_particles:
+      return
+    result = {}
+    def read():
+      try:
+        result["chunk"] = self.readChunk(index)
+      except Exception as e:
+        result["error"] = e
+    thread = threading.Thread(target=read)
+    thread.daemon = True
+    thread.start()
+    self.prefetch_index, self.prefetch_thread, self.prefetch_result = index, thread, result
+
+  def getChunk(self,index):
+    """
+    Returns the chunk of the index, taking it from the prefetch when it
+    was read ahead, and starts the prefetch of the following chunk.
+    """
+    if index != self.chunk_index:
+      self.chunk = None #Release the old chunk before holding a third one.
+      if index == self.prefetch_index:
+        self.prefetch_thread.join()
+        if "error" in self.prefetch_result:
+          raise self.prefetch_result["error"]
+        self.chunk = self.prefetch_result["chunk"]
+      else:
+        self.chunk = self.readChunk(index)
+      self.chunk_index = index
+      self.prefetch_index, self.prefetch_thread, self.prefetch_result = None, None, {}
+      self.startPrefetch(index + 1)
+    return self.chunk
+
+  def getSlice(self,start,stop):
+    """
+    Returns the (t,x,y,z,px,py,pz) arrays of the particles start to stop.
+    The arrays are views of a chunk unless the range crosses chunks.
+    """
+    pieces = []
+    while start < stop or len(pieces) == 0:
+      index = min(start,max(self.number_of_particles - 1,0))//self.chunk_particles
+      offset = index*self.chunk_particles
+      end = max(start,min(stop,offset + self.chunk_particles))
+      pieces.append([c[start-offset:end-offset] for c in self.getChunk(index)])
+      start = end
+    if len(pieces) == 1:
+      return tuple(pieces[0])
+    return tuple([numpy.concatenate([piece[i] for piece in pieces])
+                  for i in range(len(initial_condition_keys))])
 
 def get_pulse_velocity_from_momentum(coordinate_array_dict,mass,direction="z"):
   """
@@ -56,7 +276,18 @@ def get_pulse_velocity_from_momentum(coordinate_array_dict,mass,direction="z"):
   Return value:
     The mean velocity in the provided direction.
   """
-  clight = 299792458
   mean_p = numpy.mean(coordinate_array_dict["p"+direction])
-  gamma  = numpy.sqrt(1. + (mean_p/(mass*clight))**2 )
+  gamma  = lorentz_gamma_from_momentum(mean_p,0.,0.,mass)
   return mean_p/(mass*gamma)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Converts a pickled list of per particle dicts of initial conditions to the columnar format, a directory with one memory mappable .npy file per key and a header.cfg with the units, which can be given to uem.py instead of the pickle.')
+  parser.add_argument('pickle_file', type=str, help='The path to the pickled initial conditions.')
+  parser.add_argument('directory', type=str, nargs='?', help='The directory to write.  Defaults to the pickle file path without its extension.', default=None)
+  args = parser.parse_args()
+
+  directory = args.directory
+  if directory is None:
+    directory = os.path.splitext(args.pickle_file)[0]
+  convert_pickle_to_columns(args.pickle_file,directory)
+  print "Wrote " + str(read_initial_condition_header(directory)["number_of_particles"]) + " particles to " + directory
@@ -1,4 +1,5 @@
 from coordinates.coordinate_vector_3d import Cartesian3DVector
+from coordinates import kinematics
 from warp import *
 
 def steves_injectelectrons(top, t_inj, x_inj, y_inj, z_inj, px_inj, py_inj, pz_inj, charg_mass_ratio,
@@ -7,15 +8,20 @@ def steves_injectelectrons(top, t_inj, x_inj, y_inj, z_inj, px_inj, py_inj, pz_i
   I tried my own approach, but it was signifcantly slower and broken to boot (I see why, but I didn't
   fix it).  Returned to Steve's original code.
   Function to inject electrons macroparticles each time step.
-    * Present version assumes nonrelativisit dynamics for all injected electrons.  After injection, 
+    * Present version assumes nonrelativisit dynamics for all injected electrons unless the flag
+      relativistic_injection = True, in which case v = p/(gamma m) is used.  After injection, 
       electrons can be advanced relativisitically or not depending on setting of top.lrelativ .  
     * Works by finding all birthed particles between present time (top.time) and next time step 
-      (top.time + top.dt) and injecting those particles.   
-    * If flag adj_inject = True/False, then injected particle coordinates are/are not 
+      (top.time + top.dt) and injecting those particles.  The ElectronInjector passes only the
+      time sorted slice of the current step, so the search costs O(k) for k injected particles.
+    * If flag adjust_position = True/False, then injected particle coordinates are/are not 
       adjusted to account for difference of birth time and time at end of timestep. This just 
-      adjusts positions in a free-streaming NR sense. If adj_inject_p = True/False the momenta/velocities 
-      are also NR adjusted with the self-consistent EM-field data using the Lorentz force eqn.  
-    * In the above correction of momenta/velocities the magnetic field will only be nonzero if the 
+      adjusts positions in a free-streaming sense. If adjust_velocity = True/False the velocities 
+      are also adjusted with the self-consistent EM-field data by a Boris push (see
+      advance_velocity_over_remaining_time).  With both flags the adjustment is a leapfrog: half
+      drift, kick at the midpoint, half drift.  Both flags default to False; advance_position and
+      advance_velocity are accepted as older names.
+    * In the above correction of velocities the magnetic field will only be nonzero if the 
       simulation is electromagnetic.
     Args:
       top: The top object from warp.
@@ -38,20 +44,32 @@ def steves_injectelectrons(top, t_inj, x_inj, y_inj, z_inj, px_inj, py_inj, pz_i
   pyinj = py_inj[indices]
   pzinj = pz_inj[indices]
   # Calculate macro particle velocities and inverse gamma factors to inject
-  #ginj  = sqrt(1. + (pxinj**2 + pyinj**2 + pzinj**2)/(emass*clight)**2 )
-  #giinj = 1./ginj
-  giinj = ones(ninj)     # inverse gamma = 1., NR limit 
+  if flags.get("relativistic_injection",False):
+    giinj = 1./kinematics.lorentz_gamma_from_momentum(pxinj,pyinj,pzinj,top.emass)
+  else:
+    giinj = ones(ninj)     # inverse gamma = 1., NR limit 
   vxinj = giinj*pxinj/top.emass 
   vyinj = giinj*pyinj/top.emass 
   vzinj = giinj*pzinj/top.emass 
-  # Adjust particle coordinates (Nonrelativistic formulas) to inject 
-  if "advance_position" in flags:
-    if flags["advance_position"]:
-      xinj,yinj,zinj = advance_position_over_remaining_time(top.time+top.dt,tinj,xinj,yinj,zinj,
+  # Adjust particle coordinates to inject.  advance_* is the older name of the adjust_* flags.
+  adjust_position = flags.get("adjust_position",flags.get("advance_position",False))
+  adjust_velocity = flags.get("adjust_velocity",flags.get("advance_velocity",False)) and ninj > 0
+  goal_time = top.time + top.dt
+  if adjust_velocity:
+    kick_time = tinj
+    if adjust_position: # Leapfrog: drift to the middle of the remaining time, kick, drift the rest.
+      kick_time = 0.5*(tinj + goal_time)
+      xinj,yinj,zinj = advance_position_over_remaining_time(kick_time,tinj,xinj,yinj,zinj,
                          vxinj,vyinj,vzinj)
-  if "advance_velocity" in flags:
-    if flags["advance_velocity"]:
-      vxinj,vyinj,vzinj = advance_position_over_remaining_time(top.time+top.dt,vxinj,vyinj,vzinj)
+    vxinj,vyinj,vzinj,giinj = advance_velocity_over_remaining_time(goal_time,tinj,xinj,yinj,zinj,
+                                vxinj,vyinj,vzinj,charg_mass_ratio,electrons,giinj,
+                                flags.get("relativistic_injection",False))
+    if adjust_position:
+      xinj,yinj,zinj = advance_position_over_remaining_time(goal_time,kick_time,xinj,yinj,zinj,
+                         vxinj,vyinj,vzinj)
+  elif adjust_position:
+    xinj,yinj,zinj = advance_position_over_remaining_time(goal_time,tinj,xinj,yinj,zinj,
+                       vxinj,vyinj,vzinj)
 
   # Inject electron macroparticles 
   electrons.addparticles(x=xinj,y=yinj,z=zinj,vx=vxinj,vy=vyinj,vz=vzinj,gi=giinj)
@@ -67,7 +85,7 @@ def continue_injectelectrons(top, xinj, yinj, zinj, vxinj, vyinj, vzinj, electro
       None --- although the electrons container is modified in place.
   """
   # Calculate macro particle velocities and inverse gamma factors to inject
-  giinj  = sqrt( 1.  - (vxinj**2 + vyinj**2 + vzinj**2)/(top.clight**2) )
+  giinj  = kinematics.inverse_lorentz_gamma_from_velocity(vxinj,vyinj,vzinj)
   # Inject electron macroparticles 
   electrons.addparticles(x=xinj,y=yinj,z=zinj,vx=vxinj,vy=vyinj,vz=vzinj,gi=giinj)
 
@@ -89,23 +107,55 @@ def advance_position_over_remaining_time(goal_time,tinj,xinj,yinj,zinj,vxinj,vyi
   zinj += vzinj*dt 
   return (xinj,yinj,zinj)
 
-def advance_velocity_over_remaining_time(goal_time,tinj,xinj,yinj,zinj,vxinj,vyinj,vzinj,charge_mass_ratio):
+def advance_velocity_over_remaining_time(goal_time,tinj,xinj,yinj,zinj,vxinj,vyinj,vzinj,charge_mass_ratio,
+                                         electrons,giinj=None,relativistic=False):
   """
-  Advances the particle from its attribute time to the goal time.
-  velocity correction using both E- and B-fields: B-field only 
-  nonzero for EM fieldsolve 
+  Advances the velocities of the particles from their attribute time to the 
+  goal time with a Boris push through the self-consistent fields: a half kick
+  by E, a rotation by B and a second half kick by E, each particle over its own
+  remaining time.  The fields of the whole batch are gathered with one
+  fetche3dfrompositions call; B is only nonzero for EM fieldsolves.
     Args:
       goal_time: The time to which we want our particle to progress.
       (t,x,y,z,vx,vy,vz)_inj: Numpy arrays with the time, position 
-        and velocity coordinates of the particles.
+        and velocity coordinates of the particles.  The fields are taken
+        at the given positions, e.g. the midpoints of the remaining drift.
+      charge_mass_ratio: e/m_e --- the electron charge is negative.
+      electrons: The species the particles are injected into.
+      giinj: The inverse gamma factors of the particles.  Default is 1.
+      relativistic: If True, the push acts on gamma*v and the inverse
+        gamma factors are updated, otherwise gamma is held at 1/giinj.
     Return value:
-      (vx,vy,vz)_inj: Numpy arrays with velocity coordinates of the particles.
+      (vx,vy,vz,gi)_inj: Numpy arrays with velocity coordinates and inverse
+        gamma factors of the particles.
   """
+  ninj = len(tinj)
+  if giinj is None:
+    giinj = ones(ninj)
+  dt = goal_time - tinj
   ex = zeros(ninj); ey = zeros(ninj); ez = zeros(ninj) 
   bx = zeros(ninj); by = zeros(ninj); bz = zeros(ninj)
-  fetche3dfrompositions(electrons.sid,1,len(phase_volume_to_inject),xinj,yinj,zinj,ex,ey,ez,bx,by,bz)
-  vxinj += -charge_mass_ratio*ex*dt - charge_mass_ratio*(vyinj*bz-vzinj*by)*dt  
-  vyinj += -charge_mass_ratio*ey*dt - charge_mass_ratio*(vzinj*bx-vxinj*bz)*dt 
-  vzinj += -charge_mass_ratio*ez*dt - charge_mass_ratio*(vxinj*by-vzinj*bx)*dt 
-  return (vxinj,vyinj,vzinj)
-  
+  fetche3dfrompositions(electrons.sid,1,ninj,xinj,yinj,zinj,ex,ey,ez,bx,by,bz)
+  # Half kick by E on u = gamma*v
+  half_kick = -0.5*charge_mass_ratio*dt
+  uxinj = vxinj/giinj + half_kick*ex
+  uyinj = vyinj/giinj + half_kick*ey
+  uzinj = vzinj/giinj + half_kick*ez
+  # Rotation by B with the gamma of the kicked momentum
+  if relativistic:
+    giinj = 1./sqrt(1. + (uxinj**2 + uyinj**2 + uzinj**2)/clight**2)
+  tx = half_kick*giinj*bx; ty = half_kick*giinj*by; tz = half_kick*giinj*bz
+  sfactor = 2./(1. + tx**2 + ty**2 + tz**2)
+  wx = uxinj + (uyinj*tz - uzinj*ty)
+  wy = uyinj + (uzinj*tx - uxinj*tz)
+  wz = uzinj + (uxinj*ty - uyinj*tx)
+  uxinj += sfactor*(wy*tz - wz*ty)
+  uyinj += sfactor*(wz*tx - wx*tz)
+  uzinj += sfactor*(wx*ty - wy*tx)
+  # Second half kick by E
+  uxinj += half_kick*ex
+  uyinj += half_kick*ey
+  uzinj += half_kick*ez
+  if relativistic:
+    giinj = 1./sqrt(1. + (uxinj**2 + uyinj**2 + uzinj**2)/clight**2)
+  return (uxinj*giinj,uyinj*giinj,uzinj*giinj,giinj)
@@ -9,7 +9,8 @@ to be used with the FieldLoader class.
 parser.description = description
 parser.formatter_class=argparse.RawDescriptionHelpFormatter
 parser.add_argument('config_file', type=str, 
-                    help='The path to the field config file produced by prepocessing.')
+                    help='The path to the field config file produced by prepocessing, or a raw ' +
+                    'field file to take from the field cache.')
 parser.add_argument('-o','--output_prefix',  
                     dest="prefix", 
                     help='Specifies the prefix to be used for the output file.  ' + 
@@ -1,8 +1,9 @@
 from warpoptions import *
 description="""
 Preprocesses the fields so that they are in standard fortran
-order and stores them in a pickle dictionary.  A config file is 
-save alongside the pickle dictionary.  These files are then
+order and stores each component as a Fortran ordered .npy file
+(or, with --pickle, in a pickle dictionary).  A config file is 
+save alongside the field files.  These files are then
 to be used with the FieldLoader class.
 """
 #Handle command line arguments and default values with argparse.
@@ -20,15 +21,45 @@ parser.add_argument('-c', '--config_front', dest="config_front", type=str,
                     'be added and in which the processed field parameters are stored.  Default' +
                     'is the raw_field_file without its extension.', default=None) 
 parser.add_argument('-k', '--pickle_front', dest="pickle_front", type=str,
-                    help='Path to which _electric.pckl and/or _magnetic.pckl will' +
+                    help='Path to which _electric_x.npy, ... (or _electric.pckl and/or _magnetic.pckl) will' +
                     'be added and in which the processed field is stored.  Default' +
                     'is the raw_field_file without its extension.', default=None) 
+parser.add_argument('--pickle', dest="pickle", action="store_true",
+                    help='Pickles the field dictionaries instead of writing memory mappable .npy files.')
+parser.add_argument('-q', '--quadrant', dest="quadrant", action="store_true",
+                    help='Stores only the x >= 0, y >= 0 quadrant of the grid for runs with ' +
+                    'l4symtry.  The FieldLoader installs it with 4 fold symmetry.')
+parser.add_argument('-g', '--geometry', dest="geometry", type=str, choices=["auto","xyz"],
+                    help='How RZ fields are stored.  auto keeps them on their RZ grid and the ' +
+                    'FieldLoader picks the geometry of the solver when installing them: as is ' +
+                    'for wrz, projected onto XYZ for w3d.  xyz projects them onto the XYZ grid ' +
+                    'here, which saves that work at every 3D start.  Quadrant storage implies xyz.  ' +
+                    'Default is auto.', default="auto")
+parser.add_argument('-w', '--workers', dest="number_of_workers", type=int,
+                    help='The number of processes used to project RZ fields onto the XYZ grid.  ' +
+                    'Default is 1, no process pool.', default=1)
+parser.add_argument('--cache', dest="cache", action="store_true",
+                    help='Stores the result in the field cache (see fields/field_cache.py) instead ' +
+                    'of next to the raw_field_file, so that a FieldLoader given the raw_field_file ' +
+                    'finds it.  The config and pickle fronts are ignored.')
+parser.add_argument('--cache_directory', dest="cache_directory", type=str,
+                    help='The field cache directory.  Default is $WARP_UEM_FIELD_CACHE or ' +
+                    '~/.cache/warp_uem/fields.', default=None)
 args = parser.parse_args()
+from fields.field_cache import FieldCache
 from fields.field_preprocessor import FieldPreProcessor
 
 print "Argument dictionary: " 
 print "\t" + "\n\t".join([k + " = " + str(v) for k, v in vars(args).iteritems()])
 
-field_preprocessor = FieldPreProcessor(args.raw_field_file,
-                      formattype = args.formattype)
-field_preprocessor.archive(args.pickle_front,args.config_front)
+preprocess_options = {"formattype": args.formattype,
+                      "number_of_workers": args.number_of_workers,
+                      "quadrant": args.quadrant,
+                      "native_rz": args.geometry == "auto"}
+if args.cache:
+  field_cache = FieldCache(args.cache_directory)
+  print "Cached config: " + field_cache.getConfigFilepath(args.raw_field_file,**preprocess_options)
+else:
+  field_preprocessor = FieldPreProcessor(args.raw_field_file,**preprocess_options)
+  field_preprocessor.archive(args.pickle_front,config_file_front=args.config_front,
+                             binary=not args.pickle)
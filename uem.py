@@ -36,7 +36,8 @@ parser.formatter_class=argparse.RawDescriptionHelpFormatter
 parser.add_argument('input_file', type=str, 
                     help='The path to the file containing the intial ' +
                     'conditions pickled dictionary - specified with the ' +
-                    'keys time, x, y, z, px, py, and pz.')
+                    'keys time, x, y, z, px, py, and pz, or the columnar initial ' +
+                    'conditions directory made from it by injectors/io.py.')
 parser.add_argument('config_file', type=str, 
                     help='The config file.  Contains a bunch of parameters ' +
                     'and references to other config files.')
@@ -64,16 +65,22 @@ parser.add_argument('--turn_off_field_solver', dest='field_solver_off',
                     action='store_true', help='Turn off field solver (for runs ' +
                     'with applied field but no self fields).  Default has the fieldsolver ' + 
                     'on.',default=False)
+parser.add_argument('--adjust_position', dest='adjust_position',
+                    action = "store_true", help="Adjust the position of the electrons " +
+                    "when they are injected for the difference between their birth time " +
+                    "and the end of the timestep.  Default has the adjustment off.", default=False)
+parser.add_argument('--adjust_velocity', dest='adjust_velocity',
+                    action = "store_true", help="Adjust the velocity of the electrons " +
+                    "when they are injected by pushing them through the fields for the " +
+                    "remaining time of the timestep.  Default has the adjustment off.", default=False)
 parser.add_argument('--turn_off_adjust_position', dest='adjust_position',
-                    action = "store_false", help="Turn off the adjustment done to " +
-                    "the position when the electrons are injected due to differences " +
-                    "betweeen the timestep and the particle's time.  Default has the " + 
-                    "adjustment on.", default=True)
+                    action = "store_false", help="Deprecated, the position adjustment " +
+                    "is now off unless --adjust_position is given.  Kept so that old " +
+                    "command lines still run.", default=False)
 parser.add_argument('--turn_off_adjust_velocity', dest='adjust_velocity',
-                    action = "store_false", help="Turn off the adjustment done to " +
-                    "the velocity when the electrons are injected due to differences " +
-                    "betweeen the timestep and the particle's time.  Default has the " + 
-                    "adjustment on.", default=True)
+                    action = "store_false", help="Deprecated, the velocity adjustment " +
+                    "is now off unless --adjust_velocity is given.  Kept so that old " +
+                    "command lines still run.", default=False)
 parser.add_argument('--iterative_phase_space_dump', dest="iterative_dump", type=int,
                     help='Tells the program to print the x, y, z, px, py, pz coordinates ' +
                     'of all the macroparticles at every iterative_dump steps.  Default is ' + 
@@ -84,6 +91,18 @@ parser.add_argument('--phase_space_dump_step_list', dest="dump_list", type=str,
                     'For example, 35,46,72 will tell the program to dump the  coordinats after ' + 
                     'the 35th, 46th, and 72nd steps.  Default is ' + 
                     'to skip this step.', default=None)
+parser.add_argument('--binary_phase_space_dump', dest="binary_dump", action="store_true",
+                    help='Write the phase space dumps as step-warp_uem.npy numpy files instead ' +
+                    'of step-warp_uem.txt ascii files.  Default is ascii.', default=False)
+parser.add_argument('--injection_plan', dest="injection_plan", type=str,
+                    help='The file the injection plan, the range of particles injected on ' +
+                    'every step and their count, is written to.  A .npz extension stores ' +
+                    'numpy arrays.  Default is injection_plan.txt.', default="injection_plan.txt")
+parser.add_argument('--stream_injection', dest="stream_chunk_particles", type=int,
+                    help='Streams the particles from the columnar initial conditions directory ' +
+                    'given as the input_file in chunks of this many particles, reading the next ' +
+                    'chunk in the background, instead of loading them all.  Default is to ' +
+                    'load all particles.', default=None)
 parser.add_argument('--revert_to_stationary_grid', dest="stationary_grid", action="store_true",
                     help='Tells the program to use the stationary grid.  Default is to use the ' +
                     'grid designed with more grid steps at the region where electrons are.', default=False)
@@ -98,10 +117,11 @@ from config.my_config import MyConfigParser, parse_key_as_numpy_array
 from config.simulation_type import get_mesh_symmetry_factor, get_solver
 from config.elements import load_elements
 from diagnostics.diagnostic_classes import DiagnosticsByTimes, DumpBySteps
-from diagnostics.phase_volume import dump_phase_volume
+from diagnostics.phase_volume import dump_phase_volume, dump_phase_volume_binary
 from diagnostics.steves_uem_diagnostics import steves_plots, electric_potential_plots
 from discrete_fourspace.mesh import get_supremum_index
-from injectors.injector_classes import ElectronInjector
+from injectors.injector_classes import ElectronInjector, StreamingElectronInjector
+from injectors.injection_plan import write_injection_plan
 from injectors.steves_uem_injection import steves_injectelectrons
 from class_and_config_conversion import set_attributes_with_config_section
 from moving_grid.moving_classes import SyncToCOM
@@ -199,17 +219,30 @@ for conductor_element in conductor_elements:
 
 # Create the electron beam species 
 momentum_unit_conversion = jperev*1.*MV/clight #Input is in MeV/c and we want si units.
-electron_injector = ElectronInjector(steves_injectelectrons,top, args.input_file,
+injector_kwargs = {"momentum_conversion": momentum_unit_conversion/args.electrons_per_macroparticle}
+if args.stream_chunk_particles is not None:
+  injector_class = StreamingElectronInjector
+  injector_kwargs["chunk_particles"] = args.stream_chunk_particles
+else:
+  injector_class = ElectronInjector
+electron_injector = injector_class(steves_injectelectrons,top, args.input_file,
                       top.echarge/top.emass, args.electrons_per_macroparticle, 
                       flags={"adjust_position": args.adjust_position,
                              "adjust_velocity": args.adjust_velocity},
-                      momentum_conversion=momentum_unit_conversion/args.electrons_per_macroparticle)
+                      **injector_kwargs)
 installuserinjection(electron_injector.callFunction)  # install injection function in timestep 
+injection_plan = electron_injector.makeInjectionPlan(adv_dt,adv_steps,top.time) # Particles to inject each step
+write_injection_plan(injection_plan,args.injection_plan)
+if injection_plan["before"] + injection_plan["after"] > 0:
+  print ("Warning: " + str(injection_plan["before"] + injection_plan["after"]) + 
+         " particles are born outside of the adv_dt/adv_steps schedule and will not be injected.")
 
 #Diagnostics
 diagnostics = DiagnosticsByTimes(steves_plots,top,top,diagnostic_times)
 installafterstep(diagnostics.callFunction) # install function myplots() to be called after each timestep
 
+if args.binary_dump:
+  dump_phase_volume = dump_phase_volume_binary
 if args.iterative_dump is not None: #Install the phase volume dump.
   dump_steps = range(args.iterative_dump,int(steps_tot),args.iterative_dump) #Every iterative_dump step.
   phase_volume_dump = DumpBySteps(dump_phase_volume,electron_injector.getElectronContainer(),